@@ -0,0 +1,223 @@
+#! /usr/bin/env python
+"""
+Benchmarks of the hot paths, on a deterministic synthetic corpus.
+One JSON object per line is written for each measure, append them to a file
+to compare runs over time.
+"""
+
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Generator
+from xml.sax.saxutils import escape
+
+from db import Db
+from locutions import Locutions, LocutionsCold
+from nlp import locutions
+from old import count_doc
+from trie import OrderedTrie
+from wiki_abstract import docs, records
+
+SCALES = {"tiny": 20, "small": 1_000, "medium": 10_000, "large": 100_000}
+PYSBD_DOCS = 1_000
+
+
+def vocabulary(size: int, seed: int = 42) -> list[str]:
+    "Pronounceable fake words, always the same for a seed"
+    rnd = random.Random(seed)
+    syllables = [c + v for c in "bcdfglmnprstv" for v in "aeiou"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rnd.choices(syllables, k=rnd.randint(1, 4))))
+    return sorted(words)
+
+
+def corpus(
+    n_docs: int,
+    vocabulary_size: int = 20_000,
+    sentences: int = 5,
+    seed: int = 42,
+) -> Generator[str, None, None]:
+    """
+    Texts of sentences of words drawn from a Zipf distribution,
+    like natural languages. The same seed gives the same corpus.
+    """
+    rnd = random.Random(seed)
+    words = vocabulary(vocabulary_size, seed)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    for _ in range(n_docs):
+        text = []
+        for _ in range(rnd.randint(1, sentences)):
+            sentence = rnd.choices(words, weights, k=rnd.randint(4, 25))
+            text.append(" ".join(sentence).capitalize() + ".")
+        yield " ".join(text)
+
+
+def dump(texts: list[str]) -> bytes:
+    "A Wikipedia abstract dump of texts"
+    out = ["<feed>"]
+    for i, text in enumerate(texts):
+        out.append(
+            f"<doc><title>Wikipedia: Doc {i}</title>"
+            f"<url>https://en.wikipedia.org/wiki/Doc_{i}</url>"
+            f"<abstract>{escape(text)}</abstract>"
+            '<links><sublink linktype="nav"><anchor>History</anchor>'
+            f"<link>https://en.wikipedia.org/wiki/Doc_{i}#History</link>"
+            "</sublink></links></doc>"
+        )
+    out.append("</feed>")
+    return "\n".join(out).encode("utf8")
+
+
+def measure(name: str, unit: str, fn: Callable[[], int]) -> dict:
+    "Run fn once, it returns the number of units it processed"
+    start = perf_counter()
+    n = fn()
+    elapsed = perf_counter() - start
+    return dict(
+        bench=name,
+        unit=unit,
+        n=n,
+        seconds=round(elapsed, 6),
+        per_second=round(n / elapsed, 1) if elapsed else None,
+    )
+
+
+def benchmarks(folder: Path, texts: list[str]) -> Generator[dict, None, None]:
+    counters = [count_doc(txt, 2, "regex") for txt in texts]
+    keys = list(dict.fromkeys(k for c in counters for k in c))
+    queries = keys[::2] + [f"{k} missing" for k in keys[1::2]]
+    random.Random(42).shuffle(queries)
+
+    def nlp(segmenter: str, texts: list[str]):
+        txt = "\n".join(texts)
+        return lambda: sum(len(ngram) for ngram in locutions(txt, 1, segmenter))
+
+    def count(segmenter: str, texts: list[str]):
+        return lambda: len([count_doc(txt, 2, segmenter) for txt in texts])
+
+    yield measure("nlp.locutions", "tokens", nlp("regex", texts))
+    yield measure("old.count_doc", "docs", count("regex", texts))
+    # pysbd, the default segmenter, is much slower, it is timed on a sample
+    sample = texts[:PYSBD_DOCS]
+    yield measure("nlp.locutions.pysbd", "tokens", nlp("pysbd", sample))
+    yield measure("old.count_doc.pysbd", "docs", count("pysbd", sample))
+
+    def parse(parser):
+        raw = dump(texts)
+        return lambda: sum(1 for _ in parser(BytesIO(raw)))
+
+    yield measure("wiki_abstract.docs", "docs", parse(docs))
+    yield measure("wiki_abstract.records", "docs", parse(records))
+
+    trie = None
+
+    def build():
+        nonlocal trie
+        trie = OrderedTrie(iter(keys))
+        return len(keys)
+
+    yield measure("trie.build", "keys", build)
+    yield measure("trie.lookup", "keys", lambda: sum(1 for k in queries if k in trie))
+
+    words = [w for txt in texts for ngram in locutions(txt, 1, "regex") for w in ngram]
+    loc = Locutions(folder / "document", create=True)
+
+    def add_document():
+        for i in range(0, len(words), 200):
+            loc.add_document(words[i : i + 200])
+        return len(words)
+
+    yield measure("locutions.add_document", "tokens", add_document)
+
+    loc = Locutions(folder / "counter", create=True)
+
+    def add_counter():
+        for counter in counters:
+            loc.add_counter(counter)
+        return len(counters)
+
+    yield measure("locutions.add_counter", "docs", add_counter)
+
+    def write():
+        loc.write()
+        return len(loc)
+
+    yield measure("locutions.write", "keys", write)
+
+    cold = LocutionsCold(folder / "counter", mapped=True)
+    known = [k for k in queries if k in cold]  # tf_idf raises on unknown keys
+    yield measure(
+        "locutions.tf_idf", "keys", lambda: len([cold.tf_idf(k) for k in known])
+    )
+    yield measure(
+        "locutions.tf_idf_many", "keys", lambda: len(cold.tf_idf_many(queries)[0])
+    )
+
+    db = Db(folder / "db")
+
+    def add_doc():
+        for counter in counters:
+            db.add_doc(counter)
+        return len(counters)
+
+    yield measure("db.add_doc", "docs", add_doc)
+    yield measure("db.tf_idf", "keys", lambda: len([db.tf_idf(k) for k in queries]))
+    db.close()
+
+
+def revision() -> str | None:
+    "Current git commit, if any"
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],  # nosec
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scale: str, seed: int = 42) -> Generator[dict, None, None]:
+    "Every benchmark of a scale, with the context of the run"
+    context = dict(
+        time=int(time.time()),
+        revision=revision(),
+        python=platform.python_version(),
+        scale=scale,
+        docs=SCALES[scale],
+        seed=seed,
+    )
+    texts = list(corpus(SCALES[scale], seed=seed))
+    with TemporaryDirectory() as temp:
+        for result in benchmarks(Path(temp), texts):
+            yield context | result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "scales", nargs="*", choices=SCALES.keys(), default=["small", "medium"]
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for scale in args.scales:
+        for result in run(scale, args.seed):
+            print(json.dumps(result), flush=True)
+            print(
+                f"{scale:>6} {result['bench']:<24} {result['per_second']:>12,.0f}",
+                f"{result['unit']}/s",
+                file=sys.stderr,
+            )
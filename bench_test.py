@@ -0,0 +1,16 @@
+from bench import corpus, run
+
+
+def test_corpus():
+    assert list(corpus(5, seed=1)) == list(corpus(5, seed=1))
+    assert list(corpus(5, seed=1)) != list(corpus(5, seed=2))
+
+
+def test_run():
+    results = list(run("tiny"))
+    assert "db.tf_idf" in {r["bench"] for r in results}
+    assert "old.count_doc.pysbd" in {r["bench"] for r in results}
+    for r in results:
+        assert "tiny" == r["scale"]
+        assert r["n"] > 0
+        assert r["seconds"] >= 0
@@ -0,0 +1,155 @@
+#! /usr/bin/env python
+"""
+Association measures of ngrams, for a whole store, in bulk.
+An ngram "x y" is scored from its count and the counts of its parts, "x", the
+ngram without its last word, and "y", its last word:
+
+* pmi: log(P(x y) / (P(x) P(y)))
+* npmi: pmi / -log(P(x y)), between -1 and 1
+* llr: Dunning's log-likelihood ratio, the G² of the 2x2 contingency table
+
+Scores are arrays aligned with the positions of the store.
+"""
+
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from locutions import LocutionsCold, MultiLocutions
+
+
+def xlogx(x: np.ndarray, expected: np.ndarray) -> np.ndarray:
+    "x log(x / expected), 0 when x is 0"
+    out = np.zeros_like(x)
+    positive = x > 0
+    out[positive] = x[positive] * np.log(x[positive] / expected[positive])
+    return out
+
+
+def measures(
+    xy: np.ndarray, x: np.ndarray, y: np.ndarray, n: float
+) -> dict[str, np.ndarray]:
+    """
+    Measures from counts of ngrams (xy), of their parts (x and y), and the
+    number of words (n). Probabilities are all by word, P(x y) <= P(x).
+    """
+    xy = xy.astype(np.float64)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    p_xy = xy / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pmi = np.log(p_xy) - np.log(x / n) - np.log(y / n)
+        npmi = pmi / -np.log(p_xy)
+    npmi[p_xy >= 1] = 1.0
+    # contingency table of x followed by y, or not, in the n words
+    k11 = xy
+    k12 = np.maximum(x - xy, 0)
+    k21 = np.maximum(y - xy, 0)
+    k22 = np.maximum(n - k11 - k12 - k21, 0)
+    row1, row2 = k11 + k12, k21 + k22
+    col1, col2 = k11 + k21, k12 + k22
+    with np.errstate(divide="ignore", invalid="ignore"):
+        llr = 2 * (
+            xlogx(k11, row1 * col1 / n)
+            + xlogx(k12, row1 * col2 / n)
+            + xlogx(k21, row2 * col1 / n)
+            + xlogx(k22, row2 * col2 / n)
+        )
+    unknown = (xy == 0) | (x == 0) | (y == 0)
+    for scores in (pmi, npmi, llr):
+        scores[unknown] = np.nan
+    return dict(pmi=pmi, npmi=npmi, llr=llr)
+
+
+def score_store(
+    ngrams: LocutionsCold,
+    prefixes: LocutionsCold,
+    words: LocutionsCold,
+    chunk: int = 1_000_000,
+) -> dict[str, np.ndarray]:
+    """
+    Measures of every ngram of a store, by position, NaN for ngrams with an
+    unknown part. prefixes is the store of ngrams one word shorter, words is
+    the store of unigrams. Keys are read chunk by chunk, counts are looked up
+    in batches.
+    """
+    size = len(ngrams)
+    tf = np.zeros(size, dtype=np.int64)
+    x = np.zeros(size, dtype=np.int64)
+    y = np.zeros(size, dtype=np.int64)
+    keys = iter(ngrams)
+    start = 0
+    while batch := list(islice(keys, chunk)):
+        ids = np.arange(start, start + len(batch))
+        tf[ids] = ngrams.counts_many(ids)[0]
+        parts = [key.rpartition(" ") for key in batch]
+        x[ids] = prefixes.get_many([p[0] for p in parts])[0]
+        y[ids] = words.get_many([p[2] for p in parts])[0]
+        start += len(batch)
+    n = float(words.counts_many(np.arange(len(words)))[0].sum())
+    return measures(tf, x, y, n)
+
+
+def score_multi(
+    store: MultiLocutions, size: int = 2, chunk: int = 1_000_000
+) -> dict[str, np.ndarray]:
+    "Measures of the ngrams of a size"
+    return score_store(store.order(size), store.order(size - 1), store.order(1), chunk)
+
+
+def top(
+    store: LocutionsCold,
+    scores: np.ndarray,
+    k: int = 100,
+    min_tf: int = 1,
+) -> list[tuple[str, float]]:
+    """
+    The k best scored keys, seen at least min_tf times.
+    Only the k winners are sorted.
+    """
+    tf = store.counts_many(np.arange(len(scores)))[0]
+    candidates = np.flatnonzero((tf >= min_tf) & ~np.isnan(scores))
+    if k < len(candidates):
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    best = candidates[np.argsort(-scores[candidates], kind="stable")]
+    return [(store.key(int(i)), float(scores[i])) for i in best]
+
+
+def write(
+    folder: Path,
+    store: LocutionsCold,
+    scores: dict[str, np.ndarray],
+    k: int = 100,
+    min_tf: int = 1,
+):
+    "Write each measure as an array, <measure>.npy, and its top k as <measure>.tsv"
+    for name, values in scores.items():
+        np.save(folder / f"{name}.npy", values)
+        with (folder / f"{name}.tsv").open("w", encoding="utf8") as f:
+            for key, score in top(store, values, k, min_tf):
+                f.write(f"{key}\t{score:.6f}\n")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "store", type=Path, help="a MultiLocutions folder, from pipeline.py --max-size"
+    )
+    parser.add_argument("--size", type=int, default=2, help="ngram size")
+    parser.add_argument("--max-size", type=int, default=3)
+    parser.add_argument("--top", type=int, default=1000)
+    parser.add_argument("--min-tf", type=int, default=5)
+    args = parser.parse_args()
+
+    multi = MultiLocutions(args.store, args.max_size, mapped=True)
+    ngrams = multi.order(args.size)
+    write(
+        args.store / str(args.size),
+        ngrams,
+        score_multi(multi, args.size),
+        args.top,
+        args.min_tf,
+    )
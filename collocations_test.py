@@ -0,0 +1,49 @@
+import math
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from collocations import measures, score_multi, top, write
+from locutions import MultiLocutions
+from old import count_doc_orders
+
+texts = [
+    "Il vit a new york depuis un an.",
+    "Elle aime new york et le chat.",
+    "Le chat mange un poisson.",
+    "Un chat noir mange le poisson.",
+    "New york est grande.",
+    "Le chien et le chat.",
+]
+
+
+def test_measures():
+    scores = measures(np.array([10, 0]), np.array([20, 5]), np.array([30, 5]), 1000.0)
+    pmi = math.log((10 / 1000) / (20 / 1000 * 30 / 1000))
+    assert round(pmi, 9) == round(scores["pmi"][0], 9)
+    assert round(pmi / -math.log(10 / 1000), 9) == round(scores["npmi"][0], 9)
+    k = [10, 10, 20, 960]
+    e = [20 * 30 / 1000, 20 * 970 / 1000, 980 * 30 / 1000, 980 * 970 / 1000]
+    llr = 2 * sum(o * math.log(o / x) for o, x in zip(k, e))
+    assert round(llr, 9) == round(scores["llr"][0], 9)
+    assert np.isnan(scores["pmi"][1]), "unknown ngram"
+
+
+def test_score_multi():
+    with TemporaryDirectory() as temp:
+        multi = MultiLocutions(Path(temp) / "multi", max_size=2, create=True)
+        for txt in texts:
+            multi.add_counters(count_doc_orders(txt, 2, "regex"))
+        multi.write()
+        bigrams = multi.order(2)
+        scores = score_multi(multi, 2, chunk=3)
+        assert len(bigrams) == len(scores["llr"])
+        best = top(bigrams, scores["llr"], k=3, min_tf=2)
+        assert "new york" == best[0][0]
+        assert ["new york", "et le"] == [key for key, _ in best], "tf >= 2"
+        npmi = scores["npmi"][~np.isnan(scores["npmi"])]
+        assert ((-1 <= npmi) & (npmi <= 1)).all()
+        write(Path(temp), bigrams, scores, k=2)
+        assert (Path(temp) / "pmi.npy").exists()
+        assert 2 == len((Path(temp) / "llr.tsv").read_text().splitlines())
@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+"""
+Read only store in a single file, for scoring nodes.
+The file is a marisa trie, followed by tf and df side by side, by trie id, and a
+footer. The trie maps each key to a dense id, a minimal perfect hash which
+also rejects unknown keys. Everything is memory-mapped, opening is instant.
+"""
+
+import math
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import numpy as np
+from marisa_trie import Trie
+
+from db import Db
+from locutions import LocutionsCold, tf_idf_many
+
+MAGIC = b"FRESHLOC"
+FOOTER = struct.Struct("<8sIQQQ")  # magic, format version, keys, total, counts offset
+FORMAT = 1
+
+
+def compile_store(store: LocutionsCold | Db, path: Path, chunk: int = 1_000_000):
+    "Write a store as a single file, the file is renamed when complete"
+    if isinstance(store, Db):
+
+        def committed():  # keys written after the last commit have no counts
+            for k, v in store.keys:
+                pos = struct.unpack("I", v)[0]
+                if pos < len(store):
+                    yield k, pos
+
+        def keys():
+            return (k.decode("utf8") for k, _ in committed())
+
+        positions = np.fromiter((pos for _, pos in committed()), dtype=np.int64)
+        tf = np.frombuffer(store.tf, dtype=np.uint32)[positions]
+        df = np.frombuffer(store.df, dtype=np.uint32)[positions]
+        total = store.n_docs
+    else:
+
+        def keys():
+            return iter(store)
+
+        tf = np.zeros(len(store), dtype=np.uint32)
+        df = np.zeros(len(store), dtype=np.uint32)
+        for start in range(0, len(store), chunk):
+            ids = np.arange(start, min(start + chunk, len(store)))
+            tf[ids], df[ids] = store.counts_many(ids)
+        total = store.total()
+    trie = Trie(keys())
+    tids = np.fromiter(map(trie.key_id, keys()), dtype=np.int64, count=len(trie))
+    counts = np.zeros((len(trie), 2), dtype=np.uint32)
+    counts[tids, 0] = tf
+    counts[tids, 1] = df
+    tmp = path.with_suffix(".tmp")
+    trie.save(str(tmp))
+    with tmp.open("ab") as f:
+        offset = f.tell() + (-f.tell() % 8)  # aligned counts
+        f.write(bytes(offset - f.tell()))
+        f.write(counts.tobytes())
+        f.write(FOOTER.pack(MAGIC, FORMAT, len(trie), total, offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Compiled:
+    "A compiled store, memory-mapped"
+
+    trie: Trie
+    counts: np.ndarray  # tf and df of each trie id
+    _total: int
+
+    def __init__(self, path: str | Path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size, self._total, offset = FOOTER.unpack_from(
+            self._mmap, len(self._mmap) - FOOTER.size
+        )
+        if magic != MAGIC or version != FORMAT:
+            raise ValueError(f"Not a compiled store {path}")
+        self.trie = Trie()
+        self.trie.mmap(str(path))  # the trie ignores what follows it
+        self.counts = np.frombuffer(
+            self._mmap, dtype=np.uint32, count=2 * size, offset=offset
+        ).reshape(size, 2)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.trie
+
+    def __getitem__(self, key: str) -> tuple[int, int]:
+        tf, df = self.counts[self.trie.key_id(key)].tolist()
+        return tf, df
+
+    def __iter__(self):
+        return self.trie.iterkeys()
+
+    def total(self) -> int:
+        return self._total
+
+    def tf_idf(self, key: str) -> float:
+        tf, df = self[key]
+        return tf * math.log(float(self._total) / df)
+
+    def get_many(
+        self, keys: Iterable[str]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        "tf, df and found mask of a batch of keys, missing keys count 0"
+        get = self.trie.get
+        tids = np.fromiter((get(k, -1) for k in keys), dtype=np.int64)
+        found = tids >= 0
+        tf = np.zeros(len(tids), dtype=np.int64)
+        df = np.zeros(len(tids), dtype=np.int64)
+        hits = self.counts[tids[found]]
+        tf[found] = hits[:, 0]
+        df[found] = hits[:, 1]
+        return tf, df, found
+
+    def tf_idf_many(self, keys: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+        "tf_idf and found mask of a batch of keys, missing keys score 0"
+        tf, df, found = self.get_many(keys)
+        return tf_idf_many(tf, df, self._total), found
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("store", type=Path, help="a Locutions or a Db folder")
+    parser.add_argument("output", type=Path)
+    args = parser.parse_args()
+
+    if (args.store / "db").exists():
+        store = Db(args.store, read_only=True)
+    else:
+        store = LocutionsCold(args.store, mapped=True)
+    compile_store(store, args.output)
@@ -0,0 +1,45 @@
+from collections import Counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from compiled import Compiled, compile_store
+from db import Db
+from locutions import Locutions, LocutionsCold
+
+
+def test_compile_locutions():
+    with TemporaryDirectory() as temp:
+        loc = Locutions(Path(temp) / "loc", create=True)
+        loc.add_document(["je", "mange", "des", "des", "carottes"])
+        loc.write()
+        loc.add_document(["des", "pois"])
+        loc.flush()
+        cold = LocutionsCold(Path(temp) / "loc")
+        compile_store(cold, Path(temp) / "loc.bin", chunk=2)
+        compiled = Compiled(Path(temp) / "loc.bin")
+        assert 5 == len(compiled)
+        assert set(cold) == set(compiled)
+        for key in cold:
+            assert cold[key] == compiled[key]
+        assert 2 == compiled.total()
+        assert "patates" not in compiled
+        keys = ["des", "patates", "pois"]
+        tf, df, found = compiled.get_many(keys)
+        assert [3, 0, 1] == tf.tolist()
+        assert [False, True, False] == (~found).tolist()
+        assert cold.tf_idf_many(keys)[0].tolist() == (
+            compiled.tf_idf_many(keys)[0].tolist()
+        )
+
+
+def test_compile_db():
+    with TemporaryDirectory() as temp:
+        d = Db(Path(temp) / "db")
+        d.add_doc(Counter(["je", "mange", "des", "des"]))
+        d.add_doc(Counter(["des", "pois"]))
+        compile_store(d, Path(temp) / "db.bin")
+        compiled = Compiled(Path(temp) / "db.bin")
+        assert (3, 2) == compiled["des"]
+        assert (1, 1) == compiled["pois"]
+        assert d.tf_idf("je") == compiled.tf_idf("je")
+        d.close()
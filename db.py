@@ -1,44 +1,103 @@
+import json
 import math
+import os
 import struct
 from array import array
-from collections import Counter
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Sequence
 
+import numpy as np
 import plyvel
 
+if TYPE_CHECKING:
+    from plyvel._plyvel import WriteBatch
+
 
 class Db:
     """
     A Db for counting tokens
     leveldb (a key/value store) is used for storing tokens, a get them an Id.
     Counting term frequency and document frequency are done with vectors, using token id as its position.
+    Recently used ids are cached, leveldb is only read on cache miss.
+    Counts are committed by write(), in new files named by a generation, and the
+    COMMIT file, replaced atomically, points to them. Keys written to leveldb
+    after the last commit, with an id past its size, are ignored, and removed
+    when the Db is opened again.
     """
+
     keys: plyvel.DB
     tf: array("I")
     df: array("I")
     n_docs: int
     size: int
+    cache: OrderedDict[bytes, int]
+    cache_size: int
+    _batch: "WriteBatch | None"
+    _pending: dict[bytes, int]
+    generation: int
+    checkpoint: dict | None
+    read_only: bool
+    _dirty: bool
 
-    def __init__(self, path: str | Path) -> None:
+    def __init__(
+        self, path: str | Path, cache_size: int = 1_000_000, read_only: bool = False
+    ) -> None:
+        """
+        Open a Db, an interrupted write is recovered.
+        read_only doesn't change anything on the disk, for readers: keys written
+        after the last commit are only ignored, nothing can be added.
+        """
         if isinstance(path, str):
             path = Path(path)
-        path.mkdir(exist_ok=True)
+        if not read_only:
+            path.mkdir(exist_ok=True)
         exist = (path / "db").exists()
         self.f_tf = path / "tf"
         self.f_df = path / "df"
         self.f_n_docs = path / "docs"
-        if not exist:
+        self.f_commit = path / "COMMIT"
+        self.f_uncommitted = path / "UNCOMMITTED"
+        self.f_prune = path / "prune.npy"
+        self.path = path
+        self.read_only = read_only
+        if not exist and not read_only:
             (path / "db").mkdir()
-        self.keys = plyvel.DB(str(path / "db"), create_if_missing=True)
+        self.keys = plyvel.DB(str(path / "db"), create_if_missing=not read_only)
         self.tf = array("I")
         self.df = array("I")
         self.size = 0
         self.n_docs = 0
-        if exist:
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self._batch = None
+        self._pending = dict()
+        self.generation = 0
+        self.checkpoint = None
+        if self.f_commit.exists():
+            commit = json.loads(self.f_commit.read_text())
+            self.generation = commit["generation"]
+            self.size = commit["size"]
+            self.n_docs = commit["docs"]
+            self.checkpoint = commit["checkpoint"]
+            with (path / f"tf.{self.generation}").open("rb") as f:
+                self.tf.fromfile(f, self.size)
+            with (path / f"df.{self.generation}").open("rb") as f:
+                self.df.fromfile(f, self.size)
+            if "prune" in commit:  # stopped before renumbering the keys
+                if read_only:
+                    self.keys.close()
+                    raise OSError(f"Interrupted prune, open {path} for writing first")
+                self._replay_prune(commit["prune"])
+        elif exist and self.f_df.exists():  # written before commits
             self.size = int(self.f_df.lstat().st_size / 4)
             self.tf.fromfile(self.f_tf.open("rb"), self.size)
             self.df.fromfile(self.f_df.open("rb"), self.size)
             self.n_docs = struct.unpack("I", self.f_n_docs.read_bytes())[0]
+        self._dirty = self.f_uncommitted.exists()
+        if self._dirty and not read_only:  # keys written after the last commit
+            self._rollback()
 
     def close(self):
         self.keys.close()
@@ -47,47 +106,263 @@ class Db:
         return self.size
 
     def __contains__(self, key) -> bool:
-        return self.keys.get(key.encode("utf8")) is not None
+        return self._id(key.encode("utf8")) is not None
 
     def __getitem__(self, key) -> tuple[int, int]:
         if isinstance(key, str):
             key = key.encode("utf8")
+        pos = self._id(key)
+        if pos is None:
+            raise KeyError(key)
+        return (self.tf[pos], self.df[pos])
+
+    def _id(self, key: bytes) -> int | None:
+        "Id of a key: from the cache, the pending batch, then leveldb"
+        pos = self.cache.get(key)
+        if pos is not None:
+            self.cache.move_to_end(key)
+            return pos
+        pos = self._pending.get(key)
+        if pos is not None:
+            return pos
         v = self.keys.get(key)
         if v is None:
-            raise KeyError(key)
+            return None
         pos = struct.unpack("I", v)[0]
-        return (self.tf[pos], self.df[pos])
+        if pos >= self.size:  # written after the last commit
+            return None
+        self._remember(key, pos)
+        return pos
+
+    def _remember(self, key: bytes, pos: int):
+        "Cache an id, the least recently used is evicted"
+        if self.cache_size == 0:
+            return
+        self.cache[key] = pos
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _new_id(self, key: bytes, wb: "WriteBatch") -> int:
+        "Give an id to a new key, with empty counts"
+        if self.read_only:
+            raise OSError(f"Read only Db {self.path}")
+        if not self._dirty:  # a crash before the next commit leaves this key
+            with self.f_uncommitted.open("wb") as f:
+                os.fsync(f.fileno())
+            self._dirty = True
+        pos = self.size
+        wb.put(key, struct.pack("I", pos))
+        if wb is self._batch:
+            self._pending[key] = pos
+        else:
+            self._remember(key, pos)
+        self.size += 1
+        self.tf.append(0)
+        self.df.append(0)
+        return pos
 
     def add_doc(self, document: Counter) -> int:
-        wb = self.keys.write_batch()
+        wb = self._batch or self.keys.write_batch()
         fresh = 0
         for k, v in document.items():
             k = k.encode("utf8")
-            pos = self.keys.get(k)
-            if pos is None:
-                wb.put(k, struct.pack("I", self.size))
-                self.size += 1
-                self.tf.append(v)
-                self.df.append(1)
+            n = self._id(k)
+            if n is None:
+                n = self._new_id(k, wb)
                 fresh += 1
-            else:
-                n = struct.unpack("I", pos)[0]
-                self.tf[n] += v
-                self.df[n] += 1
-        wb.write()
+            self.tf[n] += v
+            self.df[n] += 1
+        if wb is not self._batch:
+            wb.write()
         self.n_docs += 1
         return fresh
 
-    def write(self) -> None:
-        self.df.tofile(self.f_df.open("wb"))
-        self.tf.tofile(self.f_tf.open("wb"))
-        self.f_n_docs.open("wb").write(struct.pack("I", self.n_docs))
+    def add_docs(self, documents: Iterable[Counter]) -> int:
+        """
+        Add a batch of documents.
+        Each key of the batch is resolved once, in leveldb order, and new keys
+        are written with a single batch.
+        """
+        documents = list(documents)
+        keys = {k: k.encode("utf8") for d in documents for k in d}
+        ids = dict()
+        fresh = 0
+        with self.bulk() as wb:
+            for k, kb in sorted(keys.items(), key=lambda item: item[1]):
+                n = self._id(kb)
+                if n is None:
+                    n = self._new_id(kb, wb)
+                    fresh += 1
+                ids[k] = n
+            for document in documents:
+                for k, v in document.items():
+                    n = ids[k]
+                    self.tf[n] += v
+                    self.df[n] += 1
+        self.n_docs += len(documents)
+        return fresh
+
+    @contextmanager
+    def bulk(self):
+        """
+        Bulk ingest: new keys of all the documents added inside the block are
+        written to leveldb with one batch, when leaving it.
+        """
+        if self._batch is not None:  # already in bulk mode
+            yield self._batch
+            return
+        self._batch = self.keys.write_batch()
+        try:
+            yield self._batch
+        finally:
+            self._batch.write()
+            for k, pos in self._pending.items():
+                self._remember(k, pos)
+            self._batch = None
+            self._pending = dict()
+
+    def write(self, checkpoint: dict | None = None) -> None:
+        """
+        Commit the counts, with a checkpoint, the position of the ingest.
+        A crash leaves the previous commit.
+        """
+        self._write(checkpoint)
+
+    def _write(self, checkpoint: dict | None, **extra) -> None:
+        if self.read_only:
+            raise OSError(f"Read only Db {self.path}")
+        generation = self.generation + 1
+        for name, values in (("tf", self.tf), ("df", self.df)):
+            with (self.path / f"{name}.{generation}").open("wb") as f:
+                values.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        self._commit(generation, checkpoint, **extra)
+        for old in [self.f_tf, self.f_df, self.f_n_docs] + [
+            self.path / f"{name}.{self.generation}" for name in ("tf", "df")
+        ]:
+            old.unlink(missing_ok=True)
+        self.generation = generation
+        self.checkpoint = checkpoint
+        if self._dirty:
+            self.f_uncommitted.unlink()
+            self._dirty = False
+
+    def _commit(self, generation: int, checkpoint: dict | None, **extra) -> None:
+        "Replace the COMMIT file, atomically"
+        tmp = self.f_commit.with_suffix(".tmp")
+        with tmp.open("w") as f:
+            json.dump(
+                dict(
+                    generation=generation,
+                    size=self.size,
+                    docs=self.n_docs,
+                    checkpoint=checkpoint,
+                    **extra,
+                ),
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.f_commit)
+
+    def _rollback(self) -> None:
+        "Remove keys written after the last commit, their ids would be given again"
+        with self.keys.write_batch() as wb:
+            for key, v in self.keys:
+                if struct.unpack("I", v)[0] >= self.size:
+                    wb.delete(key)
+        self.f_uncommitted.unlink()
+        self._dirty = False
+
+    def prune(
+        self, min_tf: int = 1, min_df: int = 1, checkpoint: dict | None = None
+    ) -> int:
+        """
+        Drop keys seen less than min_tf times, or in less than min_df documents.
+        Kept keys are renumbered in order, return the number of dropped keys.
+        Pruned counts are committed, with the checkpoint, before the keys are
+        renumbered, a key which moves is recorded to replay an interrupted prune.
+        """
+        tf = np.frombuffer(self.tf, dtype=np.uint32)
+        df = np.frombuffer(self.df, dtype=np.uint32)
+        keep = (tf >= min_tf) & (df >= min_df)
+        if keep.all():  # leveldb is left as is
+            del tf, df
+            self.write(checkpoint)
+            return 0
+        ids = np.cumsum(keep) - 1
+        moved = None
+        for key, v in self.keys:
+            pos = struct.unpack("I", v)[0]
+            if pos < len(keep) and keep[pos] and ids[pos] != pos:
+                moved = dict(key=key.decode("utf8"), id=pos)
+                break
+        with self.f_prune.open("wb") as f:
+            np.save(f, keep)
+            f.flush()
+            os.fsync(f.fileno())
+        self.tf = array("I", tf[keep].tobytes())
+        self.df = array("I", df[keep].tobytes())
+        del tf, df
+        dropped = self.size - len(self.tf)
+        self.size = len(self.tf)
+        self._write(checkpoint, prune=moved)
+        self._renumber(keep)
+        self._commit(self.generation, checkpoint)
+        self.f_prune.unlink()
+        return dropped
+
+    def _renumber(self, keep: np.ndarray) -> None:
+        "Renumber kept keys in order and delete the others, in one atomic batch"
+        ids = np.cumsum(keep) - 1
+        with self.keys.write_batch() as wb:
+            for key, v in self.keys:
+                pos = struct.unpack("I", v)[0]
+                if pos < len(keep) and keep[pos]:
+                    wb.put(key, struct.pack("I", int(ids[pos])))
+                else:
+                    wb.delete(key)
+        self.cache = OrderedDict()
+
+    def _replay_prune(self, moved: dict | None) -> None:
+        "Renumber the keys of an interrupted prune, unless it was done"
+        v = None if moved is None else self.keys.get(moved["key"].encode("utf8"))
+        if moved is None or (v is not None and struct.unpack("I", v)[0] == moved["id"]):
+            self._renumber(np.load(self.f_prune))
+        self._commit(self.generation, self.checkpoint)
+        self.f_prune.unlink()
 
     def tf_idf(self, key: str) -> float:
-        pos = self.keys.get(key.encode("utf8"))
+        pos = self._id(key.encode("utf8"))
         if pos is None:
             return 0
-        pos = struct.unpack("I", pos)[0]
         tf = self.tf[pos]
         df = self.df[pos]
         return tf * math.log(float(self.n_docs) / df)
+
+    def get_many(
+        self, keys: Sequence[str]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        "tf, df and found mask of a batch of keys, missing keys count 0"
+        if not isinstance(keys, Sequence):
+            keys = list(keys)
+        ids = (self._id(k.encode("utf8")) for k in keys)
+        ids = np.fromiter(
+            (-1 if pos is None else pos for pos in ids),
+            dtype=np.int64,
+            count=len(keys),
+        )
+        found = ids >= 0
+        tf = np.zeros(len(keys), dtype=np.int64)
+        df = np.zeros(len(keys), dtype=np.int64)
+        tf[found] = np.frombuffer(self.tf, dtype=np.uint32)[ids[found]]
+        df[found] = np.frombuffer(self.df, dtype=np.uint32)[ids[found]]
+        return tf, df, found
+
+    def tf_idf_many(self, keys: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+        "tf_idf and found mask of a batch of keys, missing keys score 0"
+        tf, df, found = self.get_many(keys)
+        scores = np.zeros(len(tf), dtype=np.float64)
+        scores[found] = tf[found] * np.log(float(self.n_docs) / df[found])
+        return scores, found
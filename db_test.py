@@ -1,6 +1,9 @@
 from collections import Counter
+from pathlib import Path
 from tempfile import TemporaryDirectory
 
+import pytest
+
 from db import Db
 
 
@@ -18,3 +21,177 @@ def test_db():
         d2 = Db(temp)
         assert 2 == d2.n_docs
         assert (2, 2) == d2["mange"]
+
+
+def test_many():
+    with TemporaryDirectory() as temp:
+        d = Db(temp)
+        d.add_doc(Counter("je mange des carottes et des petits pois".split(" ")))
+        d.add_doc(Counter("je mange des croissants".split(" ")))
+        keys = ["croissants", "des", "patates"]
+        tf, df, found = d.get_many(keys)
+        assert [1, 3, 0] == list(tf)
+        assert [1, 2, 0] == list(df)
+        assert [True, True, False] == list(found)
+        scores, _ = d.tf_idf_many(keys)
+        assert [d.tf_idf(k) for k in keys] == list(scores)
+        d.close()
+
+
+def test_cache():
+    with TemporaryDirectory() as temp:
+        d = Db(temp, cache_size=2)
+        d.add_doc(Counter("je mange des carottes".split(" ")))
+        assert 2 == len(d.cache)
+        assert [b"des", b"carottes"] == list(d.cache)
+        assert (1, 1) == d["je"]
+        assert [b"carottes", b"je"] == list(d.cache), "least recently used is evicted"
+        with d.bulk():
+            d.add_doc(Counter("je mange des petits pois".split(" ")))
+            assert d.keys.get(b"pois") is None, "not written yet"
+            assert (1, 1) == d["pois"]
+            d.add_doc(Counter("des pois".split(" ")))
+        assert d.keys.get(b"pois") is not None
+        assert (2, 2) == d["pois"]
+        assert (3, 3) == d["des"]
+        d.close()
+
+
+def test_add_docs():
+    docs = [
+        Counter("je mange des carottes et des petits pois".split(" ")),
+        Counter("je mange des croissants".split(" ")),
+        Counter("des croissants".split(" ")),
+    ]
+    with TemporaryDirectory() as a, TemporaryDirectory() as b:
+        one = Db(a)
+        for doc in docs:
+            one.add_doc(doc)
+        bulk = Db(b)
+        assert 8 == bulk.add_docs(docs)
+        assert one.n_docs == bulk.n_docs
+        for k in ["je", "des", "croissants", "pois"]:
+            assert one[k] == bulk[k]
+        one.close()
+        bulk.close()
+
+
+def test_prune():
+    with TemporaryDirectory() as temp:
+        d = Db(temp)
+        d.add_doc(Counter("je mange des carottes et des petits pois".split(" ")))
+        d.add_doc(Counter("je mange des croissants".split(" ")))
+        assert 5 == d.prune(min_df=2)
+        assert 3 == len(d)
+        assert (3, 2) == d["des"]
+        assert "pois" not in d
+        d.add_doc(Counter(["pois"]))
+        assert (1, 1) == d["pois"]
+        d.write()
+        d.close()
+        again = Db(temp)
+        assert (2, 2) == again["mange"]
+        assert (1, 1) == again["pois"]
+        again.close()
+
+
+def test_resume():
+    with TemporaryDirectory() as temp:
+        d = Db(temp)
+        d.add_doc(Counter("je mange des carottes".split(" ")))
+        d.write(dict(documents=1))
+        d.add_doc(Counter("je mange des croissants".split(" ")))
+        d.close()  # stopped before the next write
+        again = Db(temp)
+        assert 4 == len(again)
+        assert 1 == again.n_docs
+        assert "croissants" not in again
+        assert dict(documents=1) == again.checkpoint
+        again.add_doc(Counter("des pois".split(" ")))
+        assert (2, 2) == again["des"]
+        assert (1, 1) == again["pois"]
+        assert "croissants" not in again
+        again.write(dict(documents=2))
+        again.close()
+        last = Db(temp)
+        assert 5 == len(last)
+        assert (1, 1) == last["pois"]
+        assert dict(documents=2) == last.checkpoint
+        assert ["COMMIT", "db", "df.2", "tf.2"] == sorted(
+            p.name for p in Path(temp).iterdir()
+        )
+        last.close()
+
+
+def test_stale_keys():
+    with TemporaryDirectory() as temp:
+        d = Db(temp)
+        d.add_doc(Counter(["je", "mange"]))
+        d.write()
+        d.add_doc(Counter(["stale"]))
+        d.close()  # stopped before the next write
+        again = Db(temp)
+        again.add_doc(Counter(["fresh"]))
+        again.write()
+        again.close()
+        last = Db(temp)
+        assert "stale" not in last
+        assert (1, 1) == last["fresh"]
+        last.close()
+
+
+def test_prune_interrupted():
+    with TemporaryDirectory() as temp:
+        d = Db(temp)
+        d.add_doc(Counter("carottes je mange des".split(" ")))
+        d.add_doc(Counter("je mange des croissants".split(" ")))
+        d.write(dict(documents=2))
+
+        def crash(keep):
+            raise KeyboardInterrupt()
+
+        d._renumber = crash  # stopped before renumbering the keys
+        with pytest.raises(KeyboardInterrupt):
+            d.prune(min_df=2, checkpoint=dict(documents=2, complete=True))
+        d.close()
+        again = Db(temp)
+        assert 3 == len(again)
+        assert (2, 2) == again["des"]
+        assert (2, 2) == again["je"]
+        assert "carottes" not in again
+        assert dict(documents=2, complete=True) == again.checkpoint
+        assert not (Path(temp) / "prune.npy").exists()
+        again.close()
+
+
+def test_prune_nothing():
+    with TemporaryDirectory() as temp:
+        d = Db(temp)
+        d.add_doc(Counter("je mange des carottes".split(" ")))
+
+        def renumber(keep):
+            raise AssertionError("keys are not rewritten")
+
+        d._renumber = renumber
+        assert 0 == d.prune(checkpoint=dict(documents=1))
+        d.close()
+        again = Db(temp)
+        assert dict(documents=1) == again.checkpoint
+        assert (1, 1) == again["carottes"]
+        again.close()
+
+
+def test_read_only():
+    with TemporaryDirectory() as temp:
+        d = Db(temp)
+        d.add_doc(Counter(["je", "mange"]))
+        d.write()
+        d.add_doc(Counter(["stale"]))
+        d.close()
+        reader = Db(temp, read_only=True)
+        assert "stale" not in reader
+        assert (1, 1) == reader["je"]
+        with pytest.raises(OSError):
+            reader.add_doc(Counter(["fresh"]))
+        reader.close()
+        assert (Path(temp) / "UNCOMMITTED").exists(), "recovery is left to writers"
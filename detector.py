@@ -0,0 +1,200 @@
+#! /usr/bin/env python
+"""
+Detect fresh locutions in a feed of documents, against a baseline store.
+"""
+
+import heapq
+import math
+from collections import Counter, deque
+
+from locutions import LocutionsCold
+from nlp import locutions
+
+
+class TopK:
+    """
+    The k best scored keys, scores can change.
+    Every offered key is kept until it's discarded: members in a min-heap, the
+    others in a max-heap, outdated entries are skipped lazily. A member whose
+    score drops is swapped with the best other key, the top is exact.
+    """
+
+    k: int
+    members: dict[str, float]
+    others: dict[str, float]
+
+    def __init__(self, k: int):
+        self.k = k
+        self.members = dict()
+        self.others = dict()
+        self._heap = []  # (score, key) of members
+        self._others = []  # (-score, key) of the others
+
+    def _lowest(self) -> tuple[float, str]:
+        while True:
+            score, key = self._heap[0]
+            if self.members.get(key) == score:
+                return score, key
+            heapq.heappop(self._heap)
+
+    def _best(self) -> tuple[float, str]:
+        while True:
+            score, key = self._others[0]
+            if self.others.get(key) == -score:
+                return -score, key
+            heapq.heappop(self._others)
+
+    def _push(self, key: str, score: float):
+        "Add or update a member"
+        self.members[key] = score
+        heapq.heappush(self._heap, (score, key))
+        if len(self._heap) > 4 * self.k + 16:  # too many outdated entries
+            self._heap = [(s, k) for k, s in self.members.items()]
+            heapq.heapify(self._heap)
+
+    def _push_other(self, key: str, score: float):
+        "Add or update a key out of the top"
+        self.others[key] = score
+        heapq.heappush(self._others, (-score, key))
+        if len(self._others) > 4 * len(self.others) + 16:
+            self._others = [(-s, k) for k, s in self.others.items()]
+            heapq.heapify(self._others)
+
+    def _balance(self):
+        "Fill the top with the best others, swap members beaten by others"
+        while self.others and len(self.members) < self.k:
+            score, key = self._best()
+            del self.others[key]
+            self._push(key, score)
+        while self.others and self.members:
+            best, best_key = self._best()
+            lowest, low_key = self._lowest()
+            if best <= lowest:
+                return
+            del self.others[best_key]
+            del self.members[low_key]
+            self._push(best_key, best)
+            self._push_other(low_key, lowest)
+
+    def offer(self, key: str, score: float):
+        "Propose a score for a key"
+        if key in self.members:
+            self._push(key, score)
+        else:
+            self._push_other(key, score)
+        self._balance()
+
+    def discard(self, key: str):
+        self.members.pop(key, None)
+        self.others.pop(key, None)
+        self._balance()
+
+    def items(self) -> list[tuple[str, float]]:
+        "Members, best first"
+        return sorted(self.members.items(), key=lambda item: item[1], reverse=True)
+
+
+class Detector:
+    """
+    Score ngrams of a feed against a read only baseline.
+    The last documents are counted in a sliding window, each ngram scores its
+    frequency in the window against its baseline frequency.
+    Only ngrams of the incoming and the leaving documents are rescored, the
+    baseline is read once per ngram while it stays in the window.
+    """
+
+    baseline: LocutionsCold
+    window: int
+    counts: Counter
+    top: TopK
+
+    def __init__(
+        self,
+        baseline: LocutionsCold,
+        k: int = 100,
+        window: int = 10_000,
+        ngram_size: int = 2,
+        segmenter: str = "regex",
+    ):
+        self.baseline = baseline
+        self.window = window
+        self.ngram_size = ngram_size
+        self.segmenter = segmenter
+        self.counts = Counter()
+        self.top = TopK(k)
+        self._docs = deque()
+        self._base = dict()
+        self._base_total = baseline.total()
+
+    def score(self, key: str) -> float:
+        """
+        Burst score: window tf times the log ratio of its window frequency
+        and its (smoothed) baseline frequency, unknown ngrams score high.
+        The window frequency is by window size, not by the documents seen so far:
+        only touched ngrams are rescored, scores of the others must stay
+        comparable while the window fills.
+        """
+        tf = self.counts[key]
+        recent = tf / self.window
+        old = (self._base[key] + 1) / (self._base_total + 1)
+        return tf * math.log(recent / old)
+
+    def add_counter(self, document: Counter):
+        "Add a document, counted as a Counter of ngrams"
+        unknown = [k for k in document if k not in self._base]
+        if unknown:
+            tf, _, _ = self.baseline.get_many(unknown)
+            self._base.update(zip(unknown, tf.tolist()))
+        self.counts.update(document)
+        self._docs.append(document)
+        touched = set(document)
+        if len(self._docs) > self.window:
+            leaving = self._docs.popleft()
+            for k, n in leaving.items():
+                n = self.counts[k] - n
+                if n:
+                    self.counts[k] = n
+                    touched.add(k)
+                else:
+                    del self.counts[k]
+                    del self._base[k]
+                    self.top.discard(k)
+                    touched.discard(k)
+        for k in touched:
+            self.top.offer(k, self.score(k))
+
+    def add(self, txt: str):
+        "Add a text"
+        self.add_counter(
+            Counter(
+                " ".join(n) for n in locutions(txt, self.ngram_size, self.segmenter)
+            )
+        )
+
+    def items(self) -> list[tuple[str, float]]:
+        "Best scored ngrams, best first"
+        return self.top.items()
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("store", help="baseline Locutions store folder")
+    parser.add_argument("-k", type=int, default=20, help="size of the top")
+    parser.add_argument("--window", type=int, default=10_000, help="documents")
+    parser.add_argument("--every", type=int, default=1000, help="print the top")
+    args = parser.parse_args()
+
+    detector = Detector(
+        LocutionsCold(args.store, mapped=True), k=args.k, window=args.window
+    )
+    start = perf_counter()
+    for i, line in enumerate(sys.stdin, 1):  # one document per line
+        detector.add(line)
+        if i % args.every == 0:
+            print(f"# {i} docs, {i / (perf_counter() - start):.0f} docs/s")
+            for key, score in detector.items():
+                print(f"{score:.2f}\t{key}")
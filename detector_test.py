@@ -0,0 +1,69 @@
+from collections import Counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from detector import Detector, TopK
+from locutions import Locutions, LocutionsCold
+
+
+def test_topk():
+    top = TopK(2)
+    top.offer("a", 1.0)
+    top.offer("b", 2.0)
+    top.offer("c", 0.5)
+    assert [("b", 2.0), ("a", 1.0)] == top.items()
+    top.offer("c", 3.0)
+    assert [("c", 3.0), ("b", 2.0)] == top.items()
+    top.offer("b", 0.1)
+    assert [("c", 3.0), ("a", 1.0)] == top.items(), "b is beaten by a"
+    top.offer("a", 0.05)
+    assert [("c", 3.0), ("b", 0.1)] == top.items()
+    top.discard("c")
+    assert [("b", 0.1), ("a", 0.05)] == top.items()
+    top.discard("b")
+    assert [("a", 0.05)] == top.items()
+
+
+def test_detector():
+    with TemporaryDirectory() as temp:
+        base = Locutions(Path(temp) / "base", create=True)
+        for _ in range(10):
+            base.add_counter(Counter(["le chat", "le chien", "la souris"]))
+        base.write()
+        detector = Detector(LocutionsCold(Path(temp) / "base"), k=2, window=3)
+        detector.add_counter(Counter(["le chat", "nouveau mot"]))
+        detector.add_counter(Counter(["le chat", "nouveau mot"]))
+        assert "nouveau mot" == detector.items()[0][0]
+        detector.add_counter(Counter(["le chat", "la souris"]))
+        detector.add_counter(Counter(["le chat", "autre chose"]))
+        assert 3 == len(detector._docs)
+        assert 1 == detector.counts["nouveau mot"]
+        detector.add_counter(Counter(["le chat"]))
+        detector.add_counter(Counter(["le chat"]))
+        assert "nouveau mot" not in detector.counts
+        assert "nouveau mot" not in dict(detector.items())
+        assert "autre chose" == detector.items()[0][0]
+
+
+def test_filling_window():
+    with TemporaryDirectory() as temp:
+        base = Locutions(Path(temp) / "base", create=True)
+        for _ in range(10):
+            base.add_counter(Counter(["le chat", "la souris"]))
+        base.write()
+        detector = Detector(LocutionsCold(Path(temp) / "base"), k=3, window=10)
+        detector.add_counter(Counter(["premier mot"]))
+        for _ in range(4):
+            detector.add_counter(Counter(["le chat", "second mot"]))
+        for key, score in detector.items():
+            assert detector.score(key) == score, "untouched scores stay comparable"
+        assert "second mot" == detector.items()[0][0]
+
+
+def test_add():
+    with TemporaryDirectory() as temp:
+        base = Locutions(Path(temp) / "base", create=True)
+        base.write()
+        detector = Detector(LocutionsCold(Path(temp) / "base"), k=3, window=1)
+        detector.add("The new york city marathon. It was fun in new york city.")
+        assert "new york" == detector.items()[0][0]
@@ -2,13 +2,25 @@ from pathlib import Path
 
 from db import Db
 from nlp import locutions
+import server
 
 if __name__ == "__main__":
     import sys
 
     sentence = " ".join(sys.argv[1:])
+    unix = Path("./fresh.sock")
+    if unix.exists():  # a server already holds the store
+        try:
+            [result] = server.score(unix, [sentence])
+        except ConnectionRefusedError:  # left by a dead server
+            pass
+        else:
+            for score, ll in zip(result["scores"], result["ngrams"]):
+                print(score, ll)
+            sys.exit(0)
     target = Path("./fresh.loc")
-    loc = Db(target)
-    for ngrams in locutions(sentence, 2):
-        ll = " ".join(ngrams)
-        print(loc.tf_idf(ll), ll)
+    loc = Db(target, read_only=True)
+    keys = [" ".join(ngrams) for ngrams in locutions(sentence, 2)]
+    scores, _ = loc.tf_idf_many(keys)
+    for score, ll in zip(scores, keys):
+        print(score, ll)
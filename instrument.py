@@ -0,0 +1,171 @@
+"""
+Cheap per stage instrumentation of a pipeline: time, items, latency and memory.
+It costs a few microseconds per measure, it can stay on.
+"""
+
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Generator, Iterable, Iterator, TextIO, TypeVar
+
+T = TypeVar("T")
+
+Hook = Callable[[str, str], None]
+
+
+def peak_rss() -> int:
+    "Peak resident memory of the process, in bytes"
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Stage:
+    "Counters of a stage"
+
+    calls: int
+    items: int
+    seconds: float
+    max_seconds: float
+    rss_growth: int
+    peak_rss: int
+
+    def __init__(self):
+        self.calls = 0
+        self.items = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rss_growth = 0
+        self.peak_rss = 0
+
+    def as_dict(self) -> dict:
+        return dict(
+            calls=self.calls,
+            items=self.items,
+            seconds=round(self.seconds, 6),
+            items_per_second=round(self.items / self.seconds, 1)
+            if self.seconds
+            else None,
+            mean_ms=round(1e3 * self.seconds / self.calls, 3) if self.calls else None,
+            max_ms=round(1e3 * self.max_seconds, 3),
+            rss_growth=self.rss_growth,
+            peak_rss=self.peak_rss,
+        )
+
+    def update(self, other: dict):
+        "Add counters of a report, from another process"
+        self.calls += other["calls"]
+        self.items += other["items"]
+        self.seconds += other["seconds"]
+        self.max_seconds = max(self.max_seconds, other["max_ms"] / 1e3)
+        self.rss_growth += other["rss_growth"]
+        self.peak_rss = max(self.peak_rss, other["peak_rss"])
+
+
+class Stages:
+    """
+    Named stages of a pipeline.
+    rss_growth of a stage is how much the process peak memory grew while it ran,
+    the stage to blame for the peak.
+    Every interval seconds, a JSON line of the report is written to log.
+    Hooks are called with ("enter" or "exit", stage name), for a sampling
+    profiler to tag its samples, active is the stack of running stages.
+    """
+
+    stages: dict[str, Stage]
+    active: list[str]
+    hooks: list[Hook]
+    interval: float
+    log: TextIO | None
+
+    def __init__(
+        self,
+        interval: float = 60.0,
+        log: TextIO | None = sys.stderr,
+        hooks: Iterable[Hook] = (),
+    ):
+        self.stages = dict()
+        self.active = []
+        self.hooks = list(hooks)
+        self.interval = interval
+        self.log = log
+        self.start = time.monotonic()
+        self._next_log = self.start + interval
+
+    def __getitem__(self, name: str) -> Stage:
+        if name not in self.stages:
+            self.stages[name] = Stage()
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name: str, items: int = 1):
+        "Measure a block, processing some items"
+        rss, start = self._enter(name)
+        try:
+            yield
+        finally:
+            self._record(name, items, time.perf_counter() - start, rss)
+            self._leave(name)
+
+    def iter(self, name: str, iterable: Iterable[T]) -> Generator[T, None, None]:
+        "Measure each step of an iterator, one item per step"
+        it: Iterator[T] = iter(iterable)
+        while True:
+            rss, start = self._enter(name)
+            try:
+                value = next(it)
+            except StopIteration:  # the end is not an item
+                return
+            else:
+                self._record(name, 1, time.perf_counter() - start, rss)
+            finally:
+                self._leave(name)
+            yield value
+
+    def _enter(self, name: str) -> tuple[int, float]:
+        for hook in self.hooks:
+            hook("enter", name)
+        self.active.append(name)
+        return peak_rss(), time.perf_counter()
+
+    def _leave(self, name: str):
+        self.active.pop()
+        for hook in self.hooks:
+            hook("exit", name)
+
+    def _record(self, name: str, items: int, elapsed: float, rss: int):
+        stage = self[name]
+        stage.calls += 1
+        stage.items += items
+        stage.seconds += elapsed
+        if elapsed > stage.max_seconds:
+            stage.max_seconds = elapsed
+        peak = peak_rss()
+        stage.rss_growth += peak - rss
+        stage.peak_rss = peak
+        if self.log is not None and time.monotonic() >= self._next_log:
+            self.write_log()
+
+    def write_log(self):
+        "Write the report as a JSON line"
+        self.log.write(json.dumps(self.report()) + "\n")
+        self.log.flush()
+        self._next_log = time.monotonic() + self.interval
+
+    def report(self) -> dict:
+        return dict(
+            elapsed=round(time.monotonic() - self.start, 3),
+            peak_rss=peak_rss(),
+            stages={name: stage.as_dict() for name, stage in self.stages.items()},
+        )
+
+    def dump(self, path: Path):
+        "Write the report as a JSON file"
+        path.write_text(json.dumps(self.report(), indent=2))
+
+    def update(self, report: dict):
+        "Add the stages of a report, from another process"
+        for name, stage in report["stages"].items():
+            self[name].update(stage)
@@ -0,0 +1,55 @@
+import io
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from instrument import Stages
+
+
+def test_stages():
+    events = []
+    log = io.StringIO()
+    stages = Stages(interval=0, log=log, hooks=[lambda e, n: events.append((e, n))])
+    for _ in stages.iter("read", range(3)):
+        with stages.stage("work", 10):
+            assert ["work"] == stages.active
+            blob = bytearray(1 << 20)
+    del blob
+    assert not stages.active
+    assert [("enter", "read"), ("exit", "read"), ("enter", "work")] == events[:3]
+    report = stages.report()
+    assert 3 == report["stages"]["read"]["calls"]
+    assert 3 == report["stages"]["read"]["items"]
+    assert 30 == report["stages"]["work"]["items"]
+    assert report["stages"]["work"]["peak_rss"] > 0
+    assert 6 == len(log.getvalue().splitlines())
+    assert (
+        report["stages"].keys()
+        == json.loads(log.getvalue().splitlines()[-1])["stages"].keys()
+    )
+
+    with TemporaryDirectory() as temp:
+        path = Path(temp) / "stages.json"
+        stages.dump(path)
+        other = Stages(log=None)
+        other.update(json.loads(path.read_text()))
+        other.update(json.loads(path.read_text()))
+        assert 60 == other.report()["stages"]["work"]["items"]
+
+
+def test_iter_error():
+    events = []
+    stages = Stages(log=None, hooks=[lambda e, n: events.append((e, n))])
+
+    def broken():
+        yield 1
+        raise ValueError("broken")
+
+    with pytest.raises(ValueError):
+        for _ in stages.iter("read", broken()):
+            pass
+    assert [] == stages.active
+    assert [("enter", "read"), ("exit", "read")] * 2 == events
+    assert 1 == stages["read"].items
@@ -1,47 +1,289 @@
 from array import array
+from bisect import bisect_left
 from collections import Counter
-from itertools import chain
+from itertools import chain, islice
+import json
 import math
+import mmap
+import os
 from pathlib import Path
 import struct
-from typing import Generator, Iterable, Self
+import shutil
+from typing import Generator, Iterable, Self, Sequence
 
-from trie import OrderedTrie
+import numpy as np
+
+from runs import merge_runs, read_run, write_run
+from trie import KeysReader, OrderedTrie
+
+
+def load_counts(path: Path, mapped: bool = False) -> array | memoryview:
+    """
+    Read an int32 array file.
+    With mapped, the file is memory-mapped read only and shared with the page cache,
+    nothing is copied.
+    """
+    values = array("I")
+    if not path.exists():
+        return values
+    size = path.lstat().st_size
+    if size == 0:  # an empty file can't be mapped
+        return values
+    if mapped:
+        with path.open("rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(m).cast("I")
+    with path.open("rb") as f:
+        values.fromfile(f, int(size / 4))  # It's int32
+    return values
+
+
+def copy_counts(values: array | memoryview) -> array:
+    "A writable copy of an int32 array or mapping"
+    copy = array("I")
+    copy.frombytes(memoryview(values).cast("B"))
+    return copy
+
+
+def write_counts(path: Path, values: array):
+    """
+    Replace an int32 array file.
+    The file is renamed over the old one, readers mapping the old file still see it.
+    """
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("wb") as f:
+        values.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+CURRENT = "CURRENT"
+CHECKPOINT = "checkpoint.json"
+
+
+def read_checkpoint(folder: Path) -> dict | None:
+    "Checkpoint written with a snapshot or a segment, if any"
+    try:
+        return json.loads((folder / CHECKPOINT).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def snapshot(folder: Path) -> Path:
+    """
+    Folder of the current snapshot of a store, named in its CURRENT file.
+    Stores written before snapshots are their own snapshot.
+    """
+    try:
+        name = (folder / CURRENT).read_text().strip()
+    except FileNotFoundError:
+        return folder
+    return folder / name
+
+
+def version(snapshot: Path) -> int:
+    "v000042 is the version 42, the store folder itself is 0"
+    if snapshot.name[:1] == "v" and snapshot.name[1:].isdigit():
+        return int(snapshot.name[1:])
+    return 0
+
+
+def sync(folder: Path):
+    "Flush the files of a folder, and the folder itself, to the disk"
+    for path in folder.iterdir():
+        if path.is_file():
+            with path.open("rb") as f:
+                os.fsync(f.fileno())
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def publish(folder: Path, name: str):
+    "Point CURRENT to a snapshot, atomically"
+    tmp = folder / f"{CURRENT}.tmp"
+    with tmp.open("w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, folder / CURRENT)
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def rollback(folder: Path):
+    """
+    Undo the last commit of a store: drop its last segment, or publish its
+    previous snapshot again. Opened stores don't see it, open them again.
+    """
+    current = snapshot(folder)
+    segments = current / "segments"
+    if segments.exists():
+        flushed = sorted(p for p in segments.iterdir() if p.suffix != ".tmp")
+        if flushed:
+            shutil.rmtree(flushed[-1])
+            return
+    previous = folder / f"v{version(current) - 1:06d}"
+    if current == folder or not previous.exists():
+        raise ValueError(f"No commit to undo in {folder}")
+    publish(folder, previous.name)
+    shutil.rmtree(current)
+
+
+class Segment:
+    """
+    Immutable result of a flush.
+    New keys get ids after the ones of the store and previous segments,
+    counts are deltas, for the sorted ids touched by the flush.
+    """
+
+    folder: Path
+    start: int
+    total: int
+    ids: array | memoryview
+    tf: array | memoryview
+    df: array | memoryview
+    _keys: OrderedTrie
+    checkpoint: dict | None
+
+    META = struct.Struct("II")  # start, total
+
+    def __init__(self, folder: Path, mapped: bool = False):
+        self.folder = folder
+        self.start, self.total = self.META.unpack((folder / "meta.bin").read_bytes())
+        self.ids = load_counts(folder / "ids.bin", mapped)
+        self.tf = load_counts(folder / "tf.bin", mapped)
+        self.df = load_counts(folder / "df.bin", mapped)
+        self._keys = OrderedTrie.fromfile(folder / "keys.txt")
+        self.checkpoint = read_checkpoint(folder)
+
+    @classmethod
+    def write(
+        cls,
+        folder: Path,
+        start: int,
+        words: Iterable[str],
+        ids: array,
+        tf: array,
+        df: array,
+        total: int,
+        mapped: bool = False,
+        checkpoint: dict | None = None,
+    ) -> Self:
+        "Write a segment, its folder is renamed when complete"
+        tmp = folder.with_suffix(".tmp")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+        with (tmp / "keys.txt").open("w") as f:
+            for word in words:
+                f.write(word)
+                f.write("\n")
+        OrderedTrie.fromfile(tmp / "keys.txt")  # compile the trie
+        write_counts(tmp / "ids.bin", ids)
+        write_counts(tmp / "tf.bin", tf)
+        write_counts(tmp / "df.bin", df)
+        (tmp / "meta.bin").write_bytes(cls.META.pack(start, total))
+        if checkpoint is not None:
+            (tmp / CHECKPOINT).write_text(json.dumps(checkpoint))
+        sync(tmp)
+        os.replace(tmp, folder)
+        return cls(folder, mapped)
+
+    def __len__(self) -> int:
+        "Number of new keys"
+        return len(self._keys)
+
+    def __contains__(self, key) -> bool:
+        return key in self._keys
+
+    def __iter__(self) -> Generator[str, None, None]:
+        return iter(self._keys)
+
+    def ord(self, key) -> int:
+        "position of the key in the store, can raise a KeyError"
+        return self.start + self._keys[key]
+
+    def ords_many(self, keys: Sequence[str]) -> np.ndarray:
+        "positions of keys in the store, -1 for keys missing in the segment"
+        ids = self._keys.lookup_many(keys)
+        ids[ids >= 0] += self.start
+        return ids
+
+    def prefix(self, prefix: str) -> tuple[list[str], np.ndarray]:
+        "New keys starting with a prefix, and their positions in the store"
+        keys, ids = self._keys.prefix(prefix)
+        return keys, ids + self.start
+
+    def delta(self, idx: int) -> tuple[int, int]:
+        "tf and df added to an id"
+        i = bisect_left(self.ids, idx)
+        if i == len(self.ids) or self.ids[i] != idx:
+            return 0, 0
+        return self.tf[i], self.df[i]
 
 
 class LocutionsCold:
-    "Read only locutions store"
-    tf: array("I")
-    df: array("I")
+    """
+    Read only locutions store.
+    It pins the snapshot current when it's opened, with the segments flushed
+    on it so far, writers can publish new snapshots meanwhile.
+    """
+    tf: array | memoryview
+    df: array | memoryview
     _total: int
     _keys: OrderedTrie
+    segments: list[Segment]
+    mapped: bool
 
-    def __init__(self, folder: str | Path, create: bool = False):
+    def __init__(self, folder: str | Path, create: bool = False, mapped: bool = False):
         if isinstance(folder, str):
             folder = Path(folder)
         if not folder.exists():
             if not create:
                 raise FileNotFoundError(f"Folder not found {folder}")
             folder.mkdir()
+            (folder / "v000000").mkdir()  # flushes before the first write go there
+            publish(folder, "v000000")
+        self.folder = folder
+        self.mapped = mapped
+        for attempt in range(3):
+            self._open(snapshot(folder))
+            try:
+                self._load()
+                break
+            except FileNotFoundError:
+                # an old snapshot can be removed while it's opened, try the new one
+                if attempt == 2 or snapshot(folder) == self.snapshot:
+                    raise
+
+    def _open(self, folder: Path):
+        self.snapshot = folder
+        self.version = version(folder)
         self.f_keys = folder / "keys.txt"
         self.f_tf = folder / "tf.bin"
         self.f_df = folder / "df.bin"
         self.f_total = folder / "total.bin"
+        self.f_segments = folder / "segments"
+
+    def _load(self):
+        mapped = self.mapped
+        # a created store, only flushed so far, has an empty keys.txt and no counts
+        empty = not self.f_keys.exists() or self.f_keys.stat().st_size == 0
+        written = self.f_tf.exists()
         if not (
-            self.f_keys.exists()
-            == self.f_tf.exists()
-            == self.f_df.exists()
-            == self.f_total.exists()
+            written == self.f_df.exists() == self.f_total.exists()
+            and (self.f_keys.exists() if written else empty)
         ):
             raise FileNotFoundError("We need both keys.txt, tf.bin, df.bin & total.bin")
-        self.tf = array("I")
-        self.df = array("I")
-        if self.f_tf.exists():
-            size = self.f_tf.lstat().st_size
-            self.tf.fromfile(self.f_tf.open("rb"), int(size / 4))  # It's int32
-        if self.f_df.exists():
-            size = self.f_df.lstat().st_size
-            self.df.fromfile(self.f_df.open("rb"), int(size / 4))  # It's int32
+        self.tf = load_counts(self.f_tf, mapped)
+        self.df = load_counts(self.f_df, mapped)
         if not self.f_keys.exists():
             self.f_keys.open("wb")
         self._keys = OrderedTrie.fromfile(self.f_keys)
@@ -49,34 +291,71 @@ class LocutionsCold:
             self._total = struct.unpack("I", self.f_total.read_bytes())[0]
         else:
             self._total = 0
+        self.segments = []
+        if self.f_segments.exists():
+            for path in sorted(self.f_segments.iterdir()):
+                if path.suffix == ".tmp":  # an interrupted flush
+                    continue
+                segment = Segment(path, mapped)
+                self.segments.append(segment)
+                self._total += segment.total
 
     def __len__(self) -> int:
-        return len(self.tf)
+        return len(self.tf) + sum(len(s) for s in self.segments)
 
     def __contains__(self, key) -> bool:
-        return key in self._keys
+        return key in self._keys or any(key in s for s in self.segments)
 
     def __getitem__(self, key) -> tuple[int, int]:
-        if key not in self._keys:
-            raise KeyError(key)
-        idx = self._keys[key]
-        return self.tf[idx], self.df[idx]
+        return self.counts(self.ord(key))
 
     def ord(self, key) -> int:
         "position of the key, can raise a KeyError"
-        return self._keys[key]
+        try:
+            return self._keys[key]
+        except KeyError:
+            for segment in self.segments:
+                if key in segment:
+                    return segment.ord(key)
+            raise
+
+    def checkpoint(self) -> dict | None:
+        "Checkpoint of the last write or flush, None if it didn't record one"
+        if self.segments:
+            return self.segments[-1].checkpoint
+        return read_checkpoint(self.snapshot)
+
+    def key(self, idx: int) -> str:
+        "key of a written position, can raise an IndexError"
+        if idx < len(self._keys):
+            return self._keys.key(idx)
+        for segment in self.segments:
+            if segment.start <= idx < segment.start + len(segment):
+                return segment._keys.key(idx - segment.start)
+        raise IndexError(idx)
+
+    def counts(self, idx: int) -> tuple[int, int]:
+        "tf and df of a position, segments included"
+        if idx < len(self.tf):
+            tf, df = self.tf[idx], self.df[idx]
+        else:
+            tf, df = 0, 0
+        for segment in self.segments:
+            d_tf, d_df = segment.delta(idx)
+            tf += d_tf
+            df += d_df
+        return tf, df
 
     def get(self, key: str, default: tuple[int, int]) -> tuple[int, int]:
         try:
-            idx = self._keys[key]
+            idx = self.ord(key)
         except KeyError:
             return default
         else:
-            return self.tf[idx], self.df[idx]
+            return self.counts(idx)
 
     def __iter__(self) -> Generator[str, None, None]:
-        for k in self._keys:
-            yield k
+        return chain(self._keys, *self.segments)
 
     def total(self) -> int:
         return self._total
@@ -85,52 +364,177 @@ class LocutionsCold:
         tf, df = self[key]
         return tf * math.log(float(self.total()) / df)
 
+    def ords_many(self, keys: Sequence[str]) -> np.ndarray:
+        "positions of keys, -1 for missing keys"
+        ids = self._keys.lookup_many(keys)
+        missing = np.flatnonzero(ids < 0)
+        for segment in self.segments:
+            if len(missing) == 0:
+                break
+            found = segment.ords_many([keys[i] for i in missing])
+            hit = found >= 0
+            ids[missing[hit]] = found[hit]
+            missing = missing[~hit]
+        return ids
+
+    def prefix_ords(self, prefix: str) -> tuple[list[str], np.ndarray]:
+        """
+        Keys starting with a prefix, and their positions, with the trie prefix search.
+        A prefix ending with a space gives the locutions starting with a word.
+        """
+        keys, ids = self._keys.prefix(prefix)
+        for segment in self.segments:
+            seg_keys, seg_ids = segment.prefix(prefix)
+            keys.extend(seg_keys)
+            ids = np.concatenate((ids, seg_ids))
+        return keys, ids
+
+    def prefix_counts(self, prefix: str) -> tuple[list[str], np.ndarray, np.ndarray]:
+        "Keys starting with a prefix, with their tf and df, in one batch"
+        keys, ids = self.prefix_ords(prefix)
+        tf, df = self.counts_many(ids)
+        return keys, tf, df
+
+    def prefix(self, prefix: str) -> Generator[tuple[str, tuple[int, int]], None, None]:
+        "Keys starting with a prefix, and their counts"
+        keys, tf, df = self.prefix_counts(prefix)
+        for key, t, d in zip(keys, tf.tolist(), df.tolist()):
+            yield key, (t, d)
+
+    def complete(self, prefix: str, k: int = 10) -> list[tuple[str, int, int]]:
+        "The k most frequent keys starting with a prefix, with their tf and df"
+        keys, tf, df = self.prefix_counts(prefix)
+        if k < len(keys):
+            top = np.argpartition(-tf, k - 1)[:k]
+        else:
+            top = np.arange(len(keys))
+        return sorted(
+            ((keys[i], int(tf[i]), int(df[i])) for i in top),
+            key=lambda c: (-c[1], c[0]),
+        )
+
+    def counts_many(self, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        "tf and df of positions, segments included, -1 positions count 0"
+        tf = np.zeros(len(ids), dtype=np.int64)
+        df = np.zeros(len(ids), dtype=np.int64)
+        base = (ids >= 0) & (ids < len(self.tf))
+        tf[base] = np.frombuffer(self.tf, dtype=np.uint32)[ids[base]]
+        df[base] = np.frombuffer(self.df, dtype=np.uint32)[ids[base]]
+        for segment in self.segments:
+            seg_ids = np.frombuffer(segment.ids, dtype=np.uint32)
+            if len(seg_ids) == 0:
+                continue
+            pos = np.searchsorted(seg_ids, ids)
+            pos[pos == len(seg_ids)] = 0
+            hit = seg_ids[pos] == ids
+            tf[hit] += np.frombuffer(segment.tf, dtype=np.uint32)[pos[hit]]
+            df[hit] += np.frombuffer(segment.df, dtype=np.uint32)[pos[hit]]
+        return tf, df
+
+    def get_many(
+        self, keys: Sequence[str]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        "tf, df and found mask of a batch of keys, missing keys count 0"
+        if not isinstance(keys, Sequence):
+            keys = list(keys)
+        ids = self.ords_many(keys)
+        tf, df = self.counts_many(ids)
+        return tf, df, ids >= 0
+
+    def tf_idf_many(self, keys: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+        "tf_idf and found mask of a batch of keys, missing keys score 0"
+        tf, df, found = self.get_many(keys)
+        return tf_idf_many(tf, df, self.total()), found
+
+
+def tf_idf_many(tf: np.ndarray, df: np.ndarray, total: int) -> np.ndarray:
+    "Vectorized tf_idf, 0 when df is 0"
+    scores = np.zeros(len(tf), dtype=np.float64)
+    known = df > 0
+    scores[known] = tf[known] * np.log(float(total) / df[known])
+    return scores
+
+
+def zeros(size: int) -> array:
+    "An int32 array filled with 0"
+    return array("I", bytes(4 * size))
+
+
 class Locutions(LocutionsCold):
     "Append only locutions store"
     new_words: dict
     new_tf: array("I")
     new_df: array("I")
     _new_total: int
+    _touched: set[int]
+    runs: list[Path]
 
-    def __init__(self, folder: str | Path, create: bool = False):
-        super().__init__(folder, create)
+    def __init__(self, folder: str | Path, create: bool = False, mapped: bool = False):
+        super().__init__(folder, create, mapped)
         self.new_words = dict()
-        self.new_tf = array("I", (0 for i in range(len(self.tf))))
-        self.new_df = array("I", (0 for i in range(len(self.tf))))
+        self.new_tf = zeros(super().__len__())
+        self.new_df = zeros(super().__len__())
         self._new_total = 0
+        self._touched = set()
+        self.f_runs = self.folder / "runs"
+        self.f_pruned = self.folder / "pruned.tsv"
+        self.runs = sorted(self.f_runs.glob("*.tsv")) if self.f_runs.exists() else []
 
-    def add_document(self, words: Iterable[str]):
-        "Add a document for word counting."
-        df = set()
-        for word in words:
-            self._add(word, 1)
-            df.add(word)
-        for word in df:
-            i = self.ord(word)
+    def add_document(self, words: Iterable[str]) -> list[int]:
+        "Add a document for word counting, return positions of its words."
+        ids = [self._add(word, 1) for word in words]
+        for i in set(ids):
             self.new_df[i] += 1
-        self._total += 1
+        self._new_total += 1
+        return ids
 
-    def add_counter(self, words: Counter):
-        "Add a Counter of words"
+    def add_counter(self, words: Counter) -> list[int]:
+        "Add a Counter of words, return positions of its words."
+        ids = []
         for word, n in words.items():
             i = self._add(word, n)
             self.new_df[i] += 1
+            ids.append(i)
         self._new_total += 1
+        return ids
+
+    def add_batch(self, tf: Counter, df: Counter, documents: int) -> int:
+        """
+        Add the counts of a batch of documents, df counts the documents of each
+        word. Words are resolved and counted in bulk.
+        Return the number of new words.
+        """
+        keys = list(tf)
+        fresh = self._add_many(
+            keys,
+            np.fromiter(tf.values(), dtype=np.int64, count=len(keys)),
+            np.fromiter((df[k] for k in keys), dtype=np.int64, count=len(keys)),
+        )
+        self._new_total += documents
+        return fresh
+
+    def add(self, key: str, tf: int, df: int) -> int:
+        "Add counts to a key, return its position"
+        i = self._add(key, tf)
+        self.new_df[i] += df
+        return i
 
     def _add(self, key: str, value: int) -> int:
         try:
             i = self.ord(key)
             self.new_tf[i] = self.new_tf[i] + value
+            self._touched.add(i)
             return i
         except KeyError:  # The key doesn't exist yet
             idx = len(self.new_tf)
             self.new_tf.append(value)
             self.new_df.append(0)  # lets prepare the df array
             self.new_words[key] = idx
+            self._touched.add(idx)
             return idx
 
     def __contains__(self, word) -> bool:
-        return word in self._keys or word in self.new_words
+        return word in self.new_words or super().__contains__(word)
 
     def __len__(self) -> int:
         return len(self.new_tf)
@@ -147,7 +551,37 @@ class Locutions(LocutionsCold):
         return (tf + self.new_tf[idx], df + self.new_df[idx])
 
     def __iter__(self) -> Generator[str, None, None]:
-        return chain(self._keys, self.new_words)
+        return chain(super().__iter__(), self.new_words)
+
+    def ords_many(self, keys: Sequence[str]) -> np.ndarray:
+        "positions of keys, -1 for missing keys"
+        ids = super().ords_many(keys)
+        if self.new_words:
+            missing = np.flatnonzero(ids < 0)
+            get = self.new_words.get
+            ids[missing] = np.fromiter(
+                (get(keys[i], -1) for i in missing.tolist()),
+                dtype=np.int64,
+                count=len(missing),
+            )
+        return ids
+
+    def prefix_ords(self, prefix: str) -> tuple[list[str], np.ndarray]:
+        "Keys starting with a prefix and their positions, new keys are scanned"
+        keys, ids = super().prefix_ords(prefix)
+        fresh = [(k, i) for k, i in self.new_words.items() if k.startswith(prefix)]
+        if fresh:
+            keys.extend(k for k, _ in fresh)
+            ids = np.concatenate((ids, np.array([i for _, i in fresh], dtype=np.int64)))
+        return keys, ids
+
+    def counts_many(self, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        "tf and df of positions, pending counts included, -1 positions count 0"
+        tf, df = super().counts_many(ids)
+        found = ids >= 0
+        tf[found] += np.frombuffer(self.new_tf, dtype=np.uint32)[ids[found]]
+        df[found] += np.frombuffer(self.new_df, dtype=np.uint32)[ids[found]]
+        return tf, df
 
     def items(self) -> Generator[tuple[str, tuple[int, int]], None, None]:
         for k in self:
@@ -156,41 +590,409 @@ class Locutions(LocutionsCold):
     def total(self) -> int:
         return self._total + self._new_total
 
-    def write(self):
-        with self.f_keys.open("a") as f:
-            for token in self.new_words:
+    def flush(
+        self, max_segments: int = 8, checkpoint: dict | None = None
+    ) -> Segment | None:
+        """
+        Write pending counts as a new segment, its cost only depends on the batch.
+        When there are too many segments, everything is merged with write().
+        A checkpoint, the position of the ingest, is committed with the counts,
+        and with the names of the spilled runs, which hold the rest of them.
+        """
+        if len(self.segments) >= max_segments:
+            self.write(checkpoint=checkpoint)
+            return None
+        if not self._touched and self._new_total == 0:
+            return None
+        if checkpoint is not None and self.runs:
+            checkpoint = dict(checkpoint, runs=[path.name for path in self.runs])
+        ids = array("I", sorted(self._touched))
+        tf = array("I", (self.new_tf[i] for i in ids))
+        df = array("I", (self.new_df[i] for i in ids))
+        n = int(self.segments[-1].folder.name) + 1 if self.segments else 0
+        segment = Segment.write(
+            self.f_segments / f"{n:06d}",
+            len(self) - len(self.new_words),
+            self.new_words,
+            ids,
+            tf,
+            df,
+            self._new_total,
+            self.mapped,
+            checkpoint,
+        )
+        self.segments.append(segment)
+        for i in ids:
+            self.new_tf[i] = 0
+            self.new_df[i] = 0
+        self.new_words = dict()
+        self._touched = set()
+        self._total += self._new_total
+        self._new_total = 0
+        return segment
+
+    def resume(self) -> dict | None:
+        """
+        Restart from the last commit: runs spilled after it are dropped.
+        Return the checkpoint of the commit, the ingest restarts after it.
+        """
+        checkpoint = self.checkpoint()
+        committed = set(checkpoint.get("runs", ())) if checkpoint else set()
+        for path in self.runs:
+            if path.name not in committed:
+                path.unlink()
+        self.runs = [path for path in self.runs if path.name in committed]
+        return checkpoint
+
+    def spill(self, budget: int = 0) -> Path | None:
+        """
+        When there are more than budget new words, write them as a sorted run
+        and forget them, the memory used by new words stays bounded.
+        Counts of existing words stay in memory, runs are merged by write().
+        Positions of spilled words are no longer valid, and their counts are not
+        visible until the next write().
+        """
+        if len(self.new_words) <= budget:
+            return None
+        start = len(self.new_tf) - len(self.new_words)
+        self.f_runs.mkdir(exist_ok=True)
+        n = int(self.runs[-1].stem) + 1 if self.runs else 0
+        path = self.f_runs / f"{n:06d}.tsv"
+        write_run(
+            path,
+            (
+                (k, self.new_tf[i], self.new_df[i])
+                for k, i in sorted(self.new_words.items())
+            ),
+        )
+        self.runs.append(path)
+        del self.new_tf[start:]
+        del self.new_df[start:]
+        self._touched = {i for i in self._touched if i < start}
+        self.new_words = dict()
+        return path
+
+    def _merge_runs(self, min_tf: int, min_df: int, archive: bool):
+        """
+        Merge spilled runs with new words, new words below min_tf or min_df are
+        dropped, or appended to pruned.tsv with archive.
+        """
+        start = len(self.new_tf) - len(self.new_words)
+        pending = [
+            (k, self.new_tf[i], self.new_df[i])
+            for k, i in sorted(self.new_words.items())
+        ]
+        del self.new_tf[start:]
+        del self.new_df[start:]
+        self._touched = {i for i in self._touched if i < start}
+        self.new_words = dict()
+        pruned = self.f_pruned.open("a", encoding="utf8") if archive else None
+        try:
+            for key, tf, df in merge_runs(
+                [read_run(path) for path in self.runs] + [pending]
+            ):
+                if (tf >= min_tf and df >= min_df) or key in self:
+                    self.add(key, tf, df)
+                elif pruned is not None:
+                    pruned.write(f"{key}\t{tf}\t{df}\n")
+        finally:
+            if pruned is not None:
+                pruned.close()
+        for path in self.runs:
+            path.unlink()
+        self.runs = []
+
+    def write(
+        self,
+        min_tf: int = 1,
+        min_df: int = 1,
+        archive: bool = False,
+        keep: int = 1,
+        checkpoint: dict | None = None,
+    ):
+        """
+        Write everything as a new snapshot, segments are merged in the main files,
+        spilled runs are merged with new words.
+        The snapshot is written in a temporary folder, synced, renamed, then
+        published in CURRENT, readers never see a partial write. The keep previous
+        snapshots are left for the readers which pinned them, older ones are removed.
+        New words seen less than min_tf times, or in less than min_df documents,
+        are pruned, archived in pruned.tsv with archive. Stored words are kept.
+        A checkpoint, the position of the ingest, is published with the snapshot.
+        """
+        if self.runs or min_tf > 1 or min_df > 1:
+            self._merge_runs(min_tf, min_df, archive)
+        name = f"v{self.version + 1:06d}"
+        tmp = self.folder / f"{name}.tmp"
+        if tmp.exists():  # an interrupted write
+            shutil.rmtree(tmp)
+        tmp.mkdir()
+        fresh_tf = copy_counts(self.tf)
+        for i, v in enumerate(self.new_tf[: len(self.tf)]):
+            if v == 0:
+                continue
+            fresh_tf[i] += v
+        fresh_tf.extend(self.new_tf[len(self.tf) :])
+        fresh_df = copy_counts(self.df)
+        for i, v in enumerate(self.new_df[: len(self.df)]):
+            if v == 0:
+                continue
+            fresh_df[i] += v
+        fresh_df.extend(self.new_df[len(self.df) :])
+        for segment in self.segments:
+            for i, tf, df in zip(segment.ids, segment.tf, segment.df):
+                fresh_tf[i] += tf
+                fresh_df[i] += df
+        tokens = chain(*self.segments, self.new_words)
+        if min_tf > 1 or min_df > 1:  # flushed new words are pruned too
+            tokens, fresh_tf, fresh_df = self._prune(
+                list(tokens), fresh_tf, fresh_df, min_tf, min_df, archive
+            )
+        f_keys = tmp / "keys.txt"
+        shutil.copyfile(self.f_keys, f_keys)
+        with f_keys.open("a") as f:
+            for token in tokens:
                 f.write(token)
                 f.write("\n")
-        with self.f_tf.open("wb") as f:
-            fresh_tf = array("I", self.tf)
-            for i, v in enumerate(self.new_tf[: len(self.tf)]):
-                if v == 0:
-                    continue
-                fresh_tf[i] += v
-            fresh_tf.extend(self.new_tf[len(self.tf) :])
-            fresh_tf.tofile(self.f_tf.open("wb"))
-        with self.f_df.open("wb") as f:
-            fresh_df = array("I", self.df)
-            for i, v in enumerate(self.new_df[: len(self.df)]):
-                if v == 0:
-                    continue
-                fresh_df[i] += v
-            fresh_df.extend(self.new_df[len(self.df) :])
-            fresh_df.tofile(self.f_df.open("wb"))
-        new_keys = OrderedTrie(self)
+        write_counts(tmp / "tf.bin", fresh_tf)
+        write_counts(tmp / "df.bin", fresh_df)
+        new_keys = OrderedTrie(KeysReader(f_keys))  # faster than restoring keys
+        new_keys.save(f_keys)
+        total = self.total()
+        (tmp / "total.bin").write_bytes(struct.pack("I", total))
+        if checkpoint is not None:
+            (tmp / CHECKPOINT).write_text(json.dumps(checkpoint))
+        sync(tmp)
+        os.replace(tmp, self.folder / name)
+        publish(self.folder, name)
+        old = self.snapshot
+        self._open(self.folder / name)
         self.new_words = dict()
-        self.new_tf = array("I", (0 for i in range(len(self.new_tf))))
+        self.new_tf = zeros(len(fresh_tf))
+        self.new_df = zeros(len(fresh_df))
+        self._touched = set()
+        if self.mapped:  # drop the copies, serve the fresh files from the page cache
+            fresh_tf = load_counts(self.f_tf, True)
+            fresh_df = load_counts(self.f_df, True)
         self.tf = fresh_tf
-        self.new_df = array("I", (0 for i in range(len(self.new_df))))
         self.df = fresh_df
         self._keys = new_keys
-        total = self.total()
-        self.f_total.write_bytes(struct.pack("I", total))
+        self.segments = []
         self._new_total = 0
         self._total = total
+        self._retire(old, keep)
+
+    def _prune(
+        self,
+        tokens: list[str],
+        tf: array,
+        df: array,
+        min_tf: int,
+        min_df: int,
+        archive: bool,
+    ) -> tuple[list[str], array, array]:
+        "Drop new words below min_tf or min_df from the keys and counts to write"
+        stored = len(self.tf)
+        tfs = np.frombuffer(tf, dtype=np.uint32)
+        dfs = np.frombuffer(df, dtype=np.uint32)
+        keep = (tfs >= min_tf) & (dfs >= min_df)
+        keep[:stored] = True
+        if keep.all():
+            return tokens, tf, df
+        if archive:
+            with self.f_pruned.open("a", encoding="utf8") as pruned:
+                for i in np.flatnonzero(~keep).tolist():
+                    pruned.write(f"{tokens[i - stored]}\t{tf[i]}\t{df[i]}\n")
+        kept = keep[stored:].tolist()
+        tokens = [token for token, k in zip(tokens, kept) if k]
+        return tokens, array("I", tfs[keep].tobytes()), array("I", dfs[keep].tobytes())
+
+    def _retire(self, old: Path, keep: int):
+        "Remove snapshots older than the keep previous ones"
+        if old == self.folder:  # files written before snapshots
+            for name in ["keys.txt", "keys.marisa", "keys.ids", "tf.bin", "df.bin"]:
+                (old / name).unlink(missing_ok=True)
+            (old / "total.bin").unlink(missing_ok=True)
+            if (old / "segments").exists():
+                shutil.rmtree(old / "segments")
+        for path in self.folder.glob("v[0-9]*"):
+            if path.suffix != ".tmp" and version(path) < self.version - keep:
+                shutil.rmtree(path)
+
+    def merge(self, other: LocutionsCold):
+        """
+        Add the counts of another store.
+        Keys are resolved in one pass, counts are added in bulk.
+        """
+        keys = list(other)
+        tf, df = other.counts_many(np.arange(len(keys)))
+        self._add_many(keys, tf, df)
+        self._new_total += other.total()
+
+    def _add_many(self, keys: list[str], tf: np.ndarray, df: np.ndarray) -> int:
+        "Add counts of unique keys in bulk, return the number of new keys"
+        ids = self.ords_many(keys)
+        found = ids >= 0
+        new_tf = np.frombuffer(self.new_tf, dtype=np.uint32)
+        new_df = np.frombuffer(self.new_df, dtype=np.uint32)
+        new_tf[ids[found]] += tf[found].astype(np.uint32)
+        new_df[ids[found]] += df[found].astype(np.uint32)
+        del new_tf, new_df  # arrays can't grow while numpy holds their buffer
+        self._touched.update(ids[found].tolist())
+        fresh = np.flatnonzero(~found)
+        start = len(self.new_tf)
+        self.new_tf.frombytes(tf[fresh].astype(np.uint32).tobytes())
+        self.new_df.frombytes(df[fresh].astype(np.uint32).tobytes())
+        self.new_words.update(
+            zip((keys[i] for i in fresh), range(start, len(self.new_tf)))
+        )
+        self._touched.update(range(start, len(self.new_tf)))
+        return len(fresh)
+
+
+def merge_stores(
+    sources: Iterable[str | Path],
+    target: str | Path,
+    chunk: int = 1_000_000,
+    min_tf: int = 1,
+    min_df: int = 1,
+) -> LocutionsCold:
+    """
+    Merge stores in a new one, out of core.
+    Keys of each store are sorted by chunks in runs on the disk, runs are merged
+    with a heap, summed counts are written as they come. Memory used by counts
+    depends on chunk, not on the vocabulary, only the trie of the keys is built
+    in memory. Keys of the new store are sorted.
+    Keys below min_tf or min_df are dropped.
+    """
+    target = Path(target)
+    target.mkdir(exist_ok=True)
+    if (target / CURRENT).exists() or (target / "keys.txt").exists():
+        raise FileExistsError(f"Store already exists {target}")
+    f_runs = target / "runs"
+    shutil.rmtree(f_runs, ignore_errors=True)  # left by an interrupted merge
+    f_runs.mkdir()
+    runs = []
+    total = 0
+    for source in sources:
+        store = LocutionsCold(source, mapped=True)
+        total += store.total()
+        keys = iter(store)
+        start = 0
+        while batch := list(islice(keys, chunk)):
+            tf, df = store.counts_many(np.arange(start, start + len(batch)))
+            start += len(batch)
+            path = f_runs / f"{len(runs):06d}.tsv"
+            write_run(path, sorted(zip(batch, tf.tolist(), df.tolist())))
+            runs.append(path)
+    name = "v000001"
+    tmp = target / f"{name}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    f_keys = tmp / "keys.txt"
+    with (
+        f_keys.open("w") as keys,
+        (tmp / "tf.bin").open("wb") as f_tf,
+        (tmp / "df.bin").open("wb") as f_df,
+    ):
+        tf = array("I")
+        df = array("I")
+        for key, t, d in merge_runs(read_run(path) for path in runs):
+            if t < min_tf or d < min_df:
+                continue
+            keys.write(key)
+            keys.write("\n")
+            tf.append(t)
+            df.append(d)
+            if len(tf) >= chunk:
+                tf.tofile(f_tf)
+                df.tofile(f_df)
+                tf = array("I")
+                df = array("I")
+        tf.tofile(f_tf)
+        df.tofile(f_df)
+    (tmp / "total.bin").write_bytes(struct.pack("I", total))
+    OrderedTrie.fromfile(f_keys)  # compile the trie
+    sync(tmp)
+    os.replace(tmp, target / name)
+    publish(target, name)
+    shutil.rmtree(f_runs)
+    return LocutionsCold(target)
+
+
+class MultiLocutions:
+    """
+    One Locutions store per ngram size, from 1 to max_size, in sub folders.
+    Each size has its own tf, df and total.
+    """
+
+    orders: list[Locutions]
+    mapped: bool
+
+    def __init__(
+        self,
+        folder: str | Path,
+        max_size: int = 3,
+        create: bool = False,
+        mapped: bool = False,
+    ):
+        if isinstance(folder, str):
+            folder = Path(folder)
+        if not folder.exists():
+            if not create:
+                raise FileNotFoundError(f"Folder not found {folder}")
+            folder.mkdir()
+        self.mapped = mapped
+        self.orders = [
+            Locutions(folder / str(size), create=create, mapped=mapped)
+            for size in range(1, max_size + 1)
+        ]
+
+    def order(self, size: int) -> Locutions:
+        "Store of the ngrams of a size"
+        return self.orders[size - 1]
+
+    def add_counters(self, counters: Sequence[Counter]):
+        "Add a document, counted with one Counter per size"
+        for loc, counter in zip(self.orders, counters):
+            loc.add_counter(counter)
+
+    def add_batch(
+        self, tfs: Sequence[Counter], dfs: Sequence[Counter], documents: int
+    ) -> int:
+        "Add the counts of a batch of documents, one tf and df per size"
+        return sum(
+            loc.add_batch(tf, df, documents)
+            for loc, tf, df in zip(self.orders, tfs, dfs)
+        )
+
+    def __getitem__(self, key: str) -> tuple[int, int]:
+        return self.order(key.count(" ") + 1)[key]
+
+    def __contains__(self, key: str) -> bool:
+        size = key.count(" ") + 1
+        return size <= len(self.orders) and key in self.order(size)
+
+    def flush(self, checkpoint: dict | None = None):
+        for loc in self.orders:
+            loc.flush(checkpoint=checkpoint)
+
+    def write(self, checkpoint: dict | None = None):
+        for loc in self.orders:
+            loc.write(checkpoint=checkpoint)
 
-    def merge(self, other: Self):
-        for k, v in other.items():
-            tf, df = v
-            self._add(k, tf)
-            self.new_df[self.ord(k)] += df
+    def resume(self) -> dict | None:
+        """
+        Checkpoint shared by every size. Sizes are committed one after the other,
+        sizes committed past the others by an interrupted flush or write are
+        rolled back.
+        """
+        checkpoints = [loc.resume() for loc in self.orders]
+        done = [(c or {}).get("documents", 0) for c in checkpoints]
+        for size, loc in enumerate(self.orders, 1):
+            if done[size - 1] > min(done):
+                rollback(loc.folder)
+                loc = Locutions(loc.folder, mapped=self.mapped)
+                self.orders[size - 1] = loc
+                checkpoints[size - 1] = loc.resume()
+        return checkpoints[done.index(min(done))]
@@ -5,7 +5,9 @@ import struct
 from tempfile import TemporaryDirectory
 from typing import Iterable
 
-from locutions import Locutions, LocutionsCold
+import pytest
+
+from locutions import Locutions, LocutionsCold, MultiLocutions, merge_stores
 
 
 class tempData:
@@ -40,6 +42,30 @@ def test_cold():
         assert (1, 1) == l["mange"]
 
 
+def test_mapped():
+    with tempDataLocutions(["je", "mange", "des", "carottes"]) as data:
+        l = LocutionsCold(data.temp.name, mapped=True)
+        assert isinstance(l.tf, memoryview)
+        assert 4 == len(l)
+        assert (1, 1) == l["mange"]
+        assert (0, 0) == l.get("patates", (0, 0))
+        assert 0.0 == l.tf_idf("mange")
+
+
+def test_hot_mapped():
+    with tempDataLocutions(["je", "mange", "des", "carottes"]) as data:
+        hot = Locutions(data.temp.name, mapped=True)
+        reader = LocutionsCold(data.temp.name, mapped=True)
+        hot.add_document(["des", "patates"])
+        assert (2, 2) == hot["des"]
+        hot.write()
+        assert isinstance(hot.tf, memoryview)
+        assert (2, 2) == hot["des"]
+        assert (1, 1) == hot["patates"]
+        assert (1, 1) == reader["des"], "old mapping is still readable"
+        assert (2, 2) == LocutionsCold(data.temp.name, mapped=True)["des"]
+
+
 def test_hot():
     with tempDataLocutions(["je", "mange", "des", "carottes"]) as data:
         hot = Locutions(data.temp.name)
@@ -64,13 +90,11 @@ def test_hot():
         assert 3 == hot.tf[2]
         assert 0 == hot.new_tf[2]
         values = array("I")
-        values.fromfile((Path(data.temp.name) / "tf.bin").open("rb"), 7)
+        values.fromfile(hot.f_tf.open("rb"), 7)
         print(values)
         assert 3 == values[2]
-        assert (
-            "pois"
-            == (Path(data.temp.name) / "keys.txt").open("r").readlines()[-1].strip()
-        )
+        assert "pois" == hot.f_keys.open("r").readlines()[-1].strip()
+        assert not (Path(data.temp.name) / "tf.bin").exists(), "files are migrated"
 
 
 def test_write():
@@ -80,15 +104,92 @@ def test_write():
         assert "des" in loc
         print(list(loc))
         loc.write()
-        keys = (Path(temp) / "test/keys.txt").read_text().split("\n")[:-1]
+        assert Path(temp) / "test/v000001" == loc.snapshot
+        assert "v000001" == (Path(temp) / "test/CURRENT").read_text()
+        keys = (Path(temp) / "test/v000001/keys.txt").read_text().split("\n")[:-1]
         assert 4 == len(keys), "keys are written"
         assert (
-            4 * 4 == (Path(temp) / "test/tf.bin").stat().st_size
+            4 * 4 == (Path(temp) / "test/v000001/tf.bin").stat().st_size
         ), "values are written"
         assert 4 == len(loc.tf)
         assert 4 == len(loc._keys)
         assert "des" in loc
         assert (1, 1) == loc["des"]
+        assert (Path(temp) / "test/v000001/keys.marisa").exists(), "the trie is saved"
+        again = LocutionsCold(Path(temp) / "test")
+        assert isinstance(again._keys.ids, memoryview)
+        assert 2 == again.ord("des")
+
+
+def test_flush():
+    with TemporaryDirectory() as temp:
+        folder = Path(temp) / "test"
+        loc = Locutions(folder, create=True)
+        loc.add_document(["je", "mange", "des", "carottes"])
+        loc.write()
+        loc.add_document(["et", "des", "petits", "pois"])
+        segment = loc.flush()
+        assert 4 == segment.start
+        assert ["et", "petits", "pois"] == list(segment)
+        assert [2, 4, 5, 6] == list(segment.ids)
+        assert 0 == loc.new_tf[2]
+        assert (2, 2) == loc["des"]
+        assert 2 == loc.total()
+        assert 4 == len(loc.tf), "main files are untouched"
+
+        loc.add_document(["des", "pois", "chiches"])
+        loc.flush()
+        cold = LocutionsCold(folder)
+        assert 2 == len(cold.segments)
+        assert (3, 3) == cold["des"]
+        assert (2, 2) == cold["pois"]
+        assert 7 == cold.ord("chiches")
+        assert 3 == cold.total()
+        assert [
+            "je",
+            "mange",
+            "des",
+            "carottes",
+            "et",
+            "petits",
+            "pois",
+            "chiches",
+        ] == list(cold)
+
+        loc.add_document(["des", "haricots"])
+        loc.write()
+        assert not loc.f_segments.exists()
+        cold = LocutionsCold(folder)
+        assert [] == cold.segments
+        assert (4, 4) == cold["des"]
+        assert (2, 2) == cold["pois"]
+        assert 8 == cold.ord("haricots")
+        assert 4 == cold.total()
+
+
+def test_flush_compaction():
+    with TemporaryDirectory() as temp:
+        loc = Locutions(Path(temp) / "test", create=True)
+        for i in range(3):
+            loc.add_document(["des", f"mot{i}"])
+            loc.flush(max_segments=2)
+        assert 0 == len(loc.segments)
+        assert (3, 3) == loc["des"]
+        assert 3 == LocutionsCold(Path(temp) / "test").total()
+
+
+def test_flush_reopen():
+    with TemporaryDirectory() as temp:
+        loc = Locutions(Path(temp) / "test", create=True)
+        loc.add_document(["je", "mange", "des", "des"])
+        loc.flush()
+        cold = LocutionsCold(Path(temp) / "test")
+        assert (2, 1) == cold["des"]
+        assert 1 == cold.total()
+        again = Locutions(Path(temp) / "test")
+        again.add_document(["des", "pois"])
+        again.write()
+        assert (3, 2) == LocutionsCold(Path(temp) / "test")["des"]
 
 
 def test_counter():
@@ -110,8 +211,12 @@ def test_merge():
         a.write()
         b.write()
         a.merge(b)
+        assert (2, 2) == a["des"]
+        assert (1, 1) == a["pois"]
         a.write()
         assert (2, 2) == a["des"]
+        assert (1, 1) == a["pois"]
+        assert 2 == a.total()
 
 
 def test_tf_idf():
@@ -126,5 +231,224 @@ def test_tf_idf():
         assert 0.0 < tf_idf < 1.0
 
 
+def test_many():
+    with TemporaryDirectory() as temp:
+        loc = Locutions(Path(temp) / "test", create=True)
+        loc.add_document(["je", "mange", "des", "carottes"])
+        loc.write()
+        loc.add_document(["et", "des", "petits", "pois"])
+        loc.flush()
+        loc.add_document(["des", "haricots"])
+        keys = ["des", "pois", "patates", "haricots", "je"]
+        tf, df, found = loc.get_many(keys)
+        assert [3, 1, 0, 1, 1] == list(tf)
+        assert [3, 1, 0, 1, 1] == list(df)
+        assert [True, True, False, True, True] == list(found)
+        scores, found = loc.tf_idf_many(keys)
+        for key, score, known in zip(keys, scores, found):
+            if known:
+                assert round(loc.tf_idf(key), 6) == round(score, 6)
+            else:
+                assert 0 == score
+
+        cold = LocutionsCold(Path(temp) / "test", mapped=True)
+        tf, df, found = cold.get_many(iter(keys))
+        assert [2, 1, 0, 0, 1] == list(tf)
+        assert [True, True, False, False, True] == list(found)
+
+
+def test_multi():
+    with TemporaryDirectory() as temp:
+        loc = MultiLocutions(Path(temp) / "test", max_size=2, create=True)
+        loc.add_counters(
+            [Counter(["je", "mange", "des", "des"]), Counter(["je mange", "mange des"])]
+        )
+        loc.add_counters([Counter(["des", "pois"]), Counter(["des pois"])])
+        loc.write()
+        again = MultiLocutions(Path(temp) / "test", max_size=2)
+        assert (3, 2) == again["des"]
+        assert (1, 1) == again["mange des"]
+        assert "des pois" in again
+        assert "je mange des" not in again
+        assert 2 == again.order(1).total()
+        assert 2 == again.order(2).total()
+
+
+def test_multi_resume():
+    with TemporaryDirectory() as temp:
+        folder = Path(temp) / "test"
+        loc = MultiLocutions(folder, max_size=2, create=True)
+        loc.add_counters([Counter(["je", "mange"]), Counter(["je mange"])])
+        loc.flush(dict(documents=1))
+        loc.add_counters([Counter(["des", "pois"]), Counter(["des pois"])])
+        loc.order(1).flush(checkpoint=dict(documents=2))  # stopped between sizes
+        again = MultiLocutions(folder, max_size=2)
+        assert dict(documents=1) == again.resume()
+        assert "pois" not in again
+        assert 1 == again.order(1).total()
+        again.add_counters([Counter(["des", "pois"]), Counter(["des pois"])])
+        again.write(dict(documents=2))
+        again.add_counters([Counter(["des"]), Counter()])
+        again.order(1).write(checkpoint=dict(documents=3))  # stopped between sizes
+        last = MultiLocutions(folder, max_size=2)
+        assert dict(documents=2) == last.resume()
+        assert (1, 1) == last["des"]
+        assert 2 == last.order(1).total() == last.order(2).total()
+        last.write(dict(documents=2))
+        assert dict(documents=2) == MultiLocutions(folder, max_size=2).resume()
+        with pytest.raises(FileNotFoundError):
+            MultiLocutions(folder, max_size=3)
+
+
+def test_spill():
+    with TemporaryDirectory() as temp:
+        loc = Locutions(Path(temp) / "test", create=True)
+        loc.add_document(["je", "mange", "des", "des"])
+        loc.write()
+        loc.add_document(["des", "pois", "carottes"])
+        assert loc.spill(budget=1) is not None
+        assert "pois" not in loc
+        assert 3 == len(loc)
+        assert loc.spill(budget=2) is None
+        loc.add_document(["pois", "je"])
+        loc.flush()
+        loc.add_document(["pois", "fleurs"])
+        loc.spill()
+        assert 2 == len(loc.runs)
+        loc.write(min_df=2, archive=True)
+        assert not loc.runs
+        assert (3, 3) == loc["pois"]
+        assert (3, 2) == loc["des"]
+        assert (1, 1) == loc["mange"], "stored words are never pruned"
+        assert "carottes" not in loc
+        assert "fleurs" not in loc
+        assert ["carottes\t1\t1", "fleurs\t1\t1"] == (
+            (Path(temp) / "test" / "pruned.tsv").read_text().splitlines()
+        )
+        assert 4 == loc.total()
+        again = LocutionsCold(Path(temp) / "test")
+        assert ["je", "mange", "des", "pois"] == list(again)
+        assert (3, 3) == again["pois"]
+
+
+def test_resume():
+    with TemporaryDirectory() as temp:
+        loc = Locutions(Path(temp) / "test", create=True)
+        loc.add_document(["je", "mange", "des", "des"])
+        loc.write(checkpoint=dict(documents=1))
+        loc.add_document(["des", "pois", "carottes"])
+        loc.spill(budget=1)
+        loc.flush(checkpoint=dict(documents=2))
+        loc.add_document(["pois", "fleurs"])
+        loc.spill()
+        assert 2 == len(loc.runs)
+        # stopped before the next flush
+        again = Locutions(Path(temp) / "test")
+        assert dict(documents=2, runs=["000000.tsv"]) == again.resume()
+        assert 1 == len(again.runs)
+        assert not (Path(temp) / "test" / "runs" / "000001.tsv").exists()
+        again.write(checkpoint=dict(documents=2, complete=True))
+        assert (1, 1) == again["pois"]
+        assert (3, 2) == again["des"]
+        assert "fleurs" not in again
+        assert 2 == again.total()
+        cold = LocutionsCold(Path(temp) / "test")
+        assert dict(documents=2, complete=True) == cold.checkpoint()
+
+
+def test_prune_flushed():
+    with TemporaryDirectory() as temp:
+        loc = Locutions(Path(temp) / "test", create=True)
+        loc.add_document(["je", "mange"])
+        loc.write()
+        loc.add_document(["je", "des", "pois"])
+        loc.flush()
+        loc.add_document(["des", "carottes"])
+        loc.write(min_df=2, archive=True)
+        assert ["je", "mange", "des"] == list(loc)
+        assert (2, 2) == loc["des"]
+        assert (1, 1) == loc["mange"], "stored words are never pruned"
+        assert ["carottes\t1\t1", "pois\t1\t1"] == (
+            (Path(temp) / "test" / "pruned.tsv").read_text().splitlines()
+        )
+        again = LocutionsCold(Path(temp) / "test")
+        assert ["je", "mange", "des"] == list(again)
+        assert (2, 2) == again["des"]
+
+
+def test_prefix():
+    with TemporaryDirectory() as temp:
+        loc = Locutions(Path(temp) / "test", create=True)
+        loc.add_counter(Counter(["new york", "new york city", "new deal", "york"]))
+        loc.add_counter(Counter(["new york", "new deal", "new york"]))
+        loc.write()
+        loc.add_counter(Counter(["new york city", "new wave"]))
+        loc.flush()
+        loc.add_counter(Counter(["new york", "new age"]))
+        assert [
+            ("new york", 4, 3),
+            ("new deal", 2, 2),
+            ("new york city", 2, 2),
+        ] == loc.complete("new ", 3)
+        assert {
+            "new york": (4, 3),
+            "new york city": (2, 2),
+            "new deal": (2, 2),
+            "new wave": (1, 1),
+            "new age": (1, 1),
+        } == dict(loc.prefix("new "))
+        keys, tf, df = loc.prefix_counts("new york")
+        assert 6 == tf.sum()
+        assert [] == loc.complete("paris")
+        loc.write()
+        cold = LocutionsCold(Path(temp) / "test")
+        assert loc.complete("new ", 10) == cold.complete("new ", 10)
+
+
+def test_snapshots():
+    with TemporaryDirectory() as temp:
+        folder = Path(temp) / "test"
+        loc = Locutions(folder, create=True)
+        loc.add_document(["je", "mange", "des", "carottes"])
+        loc.write()
+        pinned = LocutionsCold(folder, mapped=True)
+        loc.add_document(["des", "pois"])
+        loc.flush()
+        (folder / "v000002.tmp").mkdir()  # an interrupted write
+        (folder / "v000002.tmp" / "tf.bin").write_bytes(b"garbage")
+        loc.write()
+        loc.add_document(["des", "haricots"])
+        loc.write()
+        assert ["v000002", "v000003"] == sorted(p.name for p in folder.glob("v*"))
+        assert 1 == pinned.version
+        assert (1, 1) == pinned["des"], "a reader sees its snapshot"
+        assert "pois" not in pinned
+        again = LocutionsCold(folder, mapped=True)
+        assert 3 == again.version
+        assert (3, 3) == again["des"]
+        assert 3 == again.total()
+
+
+def test_merge_stores():
+    with TemporaryDirectory() as temp:
+        a = Locutions(Path(temp) / "a", create=True)
+        a.add_document(["je", "mange", "des", "des"])
+        a.add_document(["des", "pois"])
+        a.write()
+        a.add_document(["des", "carottes"])
+        a.flush()
+        b = Locutions(Path(temp) / "b", create=True)
+        b.add_document(["tu", "manges", "des", "pois"])
+        b.write()
+        merged = merge_stores([a.folder, b.folder], Path(temp) / "c", chunk=2)
+        assert sorted(set(a) | set(b)) == list(merged)
+        assert (5, 4) == merged["des"]
+        assert (2, 2) == merged["pois"]
+        assert 4 == merged.total()
+        assert not (Path(temp) / "c" / "runs").exists()
+        pruned = merge_stores([a.folder, b.folder], Path(temp) / "d", min_df=2)
+        assert ["des", "pois"] == list(pruned)
+
+
 if __name__ == "__main__":
     test_write()
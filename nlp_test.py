@@ -1,4 +1,4 @@
-from nlp import ngram, tokenize
+from nlp import agreement, locutions, ngram, split_sentences, tokenize
 
 
 def test_ngram():
@@ -16,3 +16,34 @@ def test_tokenize():
     t = list(tokenize(txt))
     assert 2 == len(t)
     assert "american" == t[0][1]
+
+
+def test_split_sentences():
+    txt = "Dr. Smith went to Washington D.C. in 1998. He met J. R. R. Tolkien there! Was it fun? The U.S. economy grew 3.5 percent."
+    assert [
+        "Dr. Smith went to Washington D.C. in 1998. ",
+        "He met J. R. R. Tolkien there! ",
+        "Was it fun? ",
+        "The U.S. economy grew 3.5 percent.",
+    ] == split_sentences(txt)
+
+
+def test_regex_tokenize():
+    txt = """
+    An American in Paris is a jazz-influenced symphonic poem (or tone poem) for orchestra by American composer George Gershwin first performed in 1928.
+    It was inspired by the time that Gershwin had spent in Paris and evokes the sights and energy of the French capital during the .
+    """
+    assert list(tokenize(txt)) == list(tokenize(txt, "regex"))
+    assert list(locutions(txt, 2)) == list(locutions(txt, 2, "regex"))
+
+
+def test_agreement():
+    texts = [
+        "Albedo is the fraction of sunlight. It is reflected by a body.",
+        "Anarchism is a political philosophy. It is skeptical of authority.",
+    ]
+    report = agreement(texts)
+    assert 2 == report["docs"]
+    assert 1.0 == report["identical"]
+    assert 1.0 == report["precision"]
+    assert 1.0 == report["recall"]
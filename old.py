@@ -3,16 +3,22 @@
 Build the db of old locutions.
 """
 
+import json
 import os
+import shutil
 from collections import Counter
+from itertools import islice
 from pathlib import Path
-from typing import Generator
+from typing import Callable, Generator, Iterable
 
 from datasets import load_dataset
 from joblib import Parallel, delayed
 
 from db import Db
-from nlp import locutions
+from instrument import Stages
+from locutions import CURRENT, Locutions, LocutionsCold, merge_stores
+from nlp import SEGMENTERS, locutions, multi_locutions
+from sketch import SketchedLocutions
 
 n_cores: int
 try:
@@ -27,51 +33,289 @@ def doc2locutions(txt: str) -> Generator[str, None, None]:
         yield " ".join(ngrams)
 
 
-def count_doc(txt: str, ngram_size: int = 3) -> Counter:
+def count_doc(txt: str, ngram_size: int = 3, segmenter: str = "pysbd") -> Counter:
     "Count all ngrams in a doc"
     # locutions return a list of ngrams, list[str], lets rebuild a short sentences for counting purpose
-    return Counter(" ".join(l) for l in locutions(txt, ngram_size))
+    return Counter(" ".join(l) for l in locutions(txt, ngram_size, segmenter))
+
+
+def count_doc_orders(
+    txt: str, max_size: int = 3, segmenter: str = "pysbd"
+) -> list[Counter]:
+    "Count ngrams of all sizes in a doc, one Counter per size, from 1 to max_size"
+    counters = [Counter() for _ in range(max_size)]
+    for size, l in multi_locutions(txt, max_size, segmenter):
+        counters[size - 1][" ".join(l)] += 1
+    return counters
 
 
 def fresh(loc: Db, sentence: str):
-    for l in locutions(sentence, 2):
-        ll = " ".join(l)
-        if ll not in loc:
+    keys = [" ".join(l) for l in locutions(sentence, 2)]
+    scores, found = loc.tf_idf_many(keys)
+    for ll, score, known in zip(keys, scores, found):
+        if not known:
             print("! ", ll)
             continue
-        score = loc.tf_idf(ll)
         print(score, ll)
 
 
+def wikipedia():
+    return load_dataset("wikipedia", "20220301.en", trust_remote_code=True)["train"]
+
+
 def count_wiki_datasets(
-    ngram_size: int = 3, n_jobs: int = 0
+    ngram_size: int = 3, n_jobs: int = 0, segmenter: str = "pysbd", start: int = 0
 ) -> Generator[Counter, None, None]:
-    datas = load_dataset("wikipedia", "20220301.en", trust_remote_code=True)["train"]
+    "Count the documents of the dataset, from the start one"
+    datas = wikipedia()
+    if start:
+        datas = datas.select(range(start, len(datas)))
     if n_jobs == 0:  # 0 means max
         n_jobs = n_cores - 1
     parallel = Parallel(n_jobs=n_jobs, return_as="generator")
     output_generator = parallel(
-        delayed(count_doc)(doc["text"], ngram_size) for doc in datas
+        delayed(count_doc)(doc["text"], ngram_size, segmenter) for doc in datas
     )
     for c in output_generator:
         yield c
 
 
+def wikipedia_shard(index: int, num_shards: int) -> Generator[str, None, None]:
+    "Texts of a contiguous shard of the Wikipedia dataset"
+    for doc in wikipedia().shard(num_shards=num_shards, index=index, contiguous=True):
+        yield doc["text"]
+
+
+def count_shard(
+    folder: Path,
+    loader: Callable[[int, int], Iterable[str]],
+    index: int,
+    num_shards: int,
+    ngram_size: int = 3,
+    segmenter: str = "pysbd",
+    flush: int = 500,
+    threshold: int = 0,
+    budget: int = 0,
+) -> Path:
+    """
+    Count a shard of texts in its own Locutions store, in a worker.
+    With a threshold, rare ngrams are counted in a sketch, and stored once
+    they reach it in the shard.
+    Without it, and with a budget, new ngrams are spilled to disk once there are
+    more than budget of them.
+    Stages are measured, and reported in stages.json.
+    Each flush commits the number of counted texts, a restarted shard skips them,
+    a complete shard is left as is. The sketch is not saved, after a restart rare
+    ngrams are sketched from 0 again.
+    """
+    stages = Stages(log=None)
+    loc = Locutions(folder, create=True)
+    checkpoint = loc.resume() or dict(documents=0)
+    if checkpoint.get("complete"):
+        if not (folder / "stages.json").exists():  # stopped before the dump
+            stages.dump(folder / "stages.json")
+        return folder
+    counter = SketchedLocutions(loc, threshold) if threshold else loc
+    done = checkpoint["documents"]
+    texts = islice(loader(index, num_shards), done, None)
+    i = done
+    for i, txt in enumerate(stages.iter("wiki", texts), done + 1):
+        with stages.stage("tokenize"):
+            ngrams = [" ".join(l) for l in locutions(txt, ngram_size, segmenter)]
+        with stages.stage("count_doc"):
+            count = Counter(ngrams)
+        with stages.stage("add_counter"):
+            counter.add_counter(count)
+        if i % flush == 0:
+            with stages.stage("flush", flush):
+                if budget and not threshold:  # spilled ngrams would be sketched again
+                    loc.spill(budget)
+                loc.flush(checkpoint=dict(documents=i))
+    with stages.stage("write"):
+        loc.write(checkpoint=dict(documents=i, complete=True))
+    stages.dump(folder / "stages.json")
+    return folder
+
+
+def count_sharded(
+    target: Path,
+    loader: Callable[[int, int], Iterable[str]] = wikipedia_shard,
+    ngram_size: int = 3,
+    n_jobs: int = 0,
+    segmenter: str = "pysbd",
+    threshold: int = 0,
+    budget: int = 0,
+    min_tf: int = 1,
+    min_df: int = 1,
+    stages: Stages | None = None,
+) -> Locutions:
+    """
+    Each worker loads its shard of texts and counts it in its own store,
+    shards are merged in the target store as they come.
+    Only store folders travel between processes.
+    With a budget, new ngrams are spilled to disk in workers, and shards are
+    merged out of core once they are all counted, budget keys at a time.
+    Ngrams below min_tf or min_df, once every shard is counted, are pruned.
+    Stages of the workers are added to the stages of the merge.
+    An interrupted run restarts where it stopped, with the same n_jobs: merged
+    shards are recorded in the checkpoint of the target, counted texts in the
+    checkpoint of each shard.
+    """
+    if stages is None:
+        stages = Stages(log=None)
+    if n_jobs == 0:  # 0 means max
+        n_jobs = n_cores - 1
+    shards = target / "shards"
+    merged = set()
+    if budget:
+        if (target / CURRENT).exists():  # shards are already merged
+            shutil.rmtree(shards, ignore_errors=True)
+            return Locutions(target)
+    else:
+        loc = Locutions(target, create=True)
+        checkpoint = loc.resume() or dict(shards=[])
+        if checkpoint.get("complete"):
+            return loc
+        merged = set(checkpoint["shards"])
+    shards.mkdir(parents=True, exist_ok=True)
+    for i in merged:  # stopped before removing it
+        shutil.rmtree(shards / f"{i:03d}", ignore_errors=True)
+    folders = []
+    parallel = Parallel(n_jobs=n_jobs, return_as="generator_unordered")
+    for folder in parallel(
+        delayed(count_shard)(
+            shards / f"{i:03d}",
+            loader,
+            i,
+            n_jobs,
+            ngram_size,
+            segmenter,
+            threshold=threshold,
+            budget=budget,
+        )
+        for i in range(n_jobs)
+        if i not in merged
+    ):
+        stages.update(json.loads((folder / "stages.json").read_text()))
+        if budget:
+            folders.append(folder)
+            continue
+        with stages.stage("merge"):
+            loc.merge(LocutionsCold(folder, mapped=True))
+            merged.add(int(folder.name))
+            loc.flush(checkpoint=dict(shards=sorted(merged)))
+        shutil.rmtree(folder)
+    if budget:
+        with stages.stage("merge"):
+            merge_stores(sorted(folders), target, budget, min_tf, min_df)
+        loc = Locutions(target)
+    else:
+        with stages.stage("write"):
+            loc.write(
+                min_tf, min_df, checkpoint=dict(shards=sorted(merged), complete=True)
+            )
+    shutil.rmtree(shards)
+    return loc
+
+
 if __name__ == "__main__":
+    import argparse
+
     from tqdm import tqdm
-    import shutil
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="count shards in worker's Locutions stores, and merge them",
+    )
+    parser.add_argument(
+        "--segmenter",
+        choices=SEGMENTERS.keys(),
+        default="pysbd",
+        help="sentence segmenter, regex is much faster than pysbd",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=int,
+        default=0,
+        help="with --sharded, ngrams stay in a count-min sketch until this tf",
+    )
+    parser.add_argument(
+        "--budget",
+        type=int,
+        default=0,
+        help="with --sharded, new ngrams kept in memory before spilling them to disk",
+    )
+    parser.add_argument(
+        "--min-tf", type=int, default=1, help="prune ngrams seen less than this"
+    )
+    parser.add_argument(
+        "--min-df", type=int, default=1, help="prune ngrams in less documents"
+    )
+    parser.add_argument(
+        "--flush",
+        type=int,
+        default=500,
+        help="documents between two checkpoints, an interrupted run resumes from the last one",
+    )
+    parser.add_argument(
+        "--fresh", action="store_true", help="start from scratch, don't resume"
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        default=Path("stages.json"),
+        help="where to dump the time and memory report of each stage",
+    )
+    parser.add_argument(
+        "--log-interval",
+        type=float,
+        default=60.0,
+        help="seconds between two JSON log lines of the stages, on stderr",
+    )
+    args = parser.parse_args()
+    stages = Stages(args.log_interval)
 
     target = Path("./fresh.loc")
-    if target.exists():
+    if args.fresh and target.exists():
         shutil.rmtree(target)
 
-    loc = Db(target)
-
-    i = 0
-    for count in tqdm(count_wiki_datasets(ngram_size=2), unit=" docs"):
-        loc.add_doc(count)
-        i += 1
-        if i == 500:
-            loc.write()
-            i = 0
-    loc.write()
+    if args.sharded:
+        wikipedia()  # download it once, before workers need it
+        count_sharded(
+            target,
+            ngram_size=2,
+            segmenter=args.segmenter,
+            threshold=args.threshold,
+            budget=args.budget,
+            min_tf=args.min_tf,
+            min_df=args.min_df,
+            stages=stages,
+        )
+    else:
+        loc = Db(target)
+        checkpoint = loc.checkpoint or dict(documents=0)
+        if not checkpoint.get("complete"):
+            i = checkpoint["documents"]
+            counts = count_wiki_datasets(
+                ngram_size=2, segmenter=args.segmenter, start=i
+            )
+            # count_doc runs in workers, its stage is the wait for their results
+            for count in tqdm(
+                stages.iter("count_doc", counts), unit=" docs", initial=i
+            ):
+                with stages.stage("add_doc"):
+                    loc.add_doc(count)
+                i += 1
+                if i % args.flush == 0:
+                    with stages.stage("write", args.flush):
+                        loc.write(dict(documents=i))
+            with stages.stage("write"):
+                checkpoint = dict(documents=i, complete=True)
+                if args.min_tf > 1 or args.min_df > 1:
+                    loc.prune(args.min_tf, args.min_df, checkpoint)
+                else:
+                    loc.write(checkpoint)
+    stages.write_log()
+    stages.dump(args.report)
@@ -1,6 +1,13 @@
+from collections import Counter
 from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
-from old import count_doc
+import pytest
+
+from instrument import Stages
+from locutions import LocutionsCold
+from old import count_doc, count_doc_orders, count_sharded
 from wiki_abstract import docs
 
 txt = """
@@ -27,3 +34,57 @@ def test_count_doc():
     d = next(docs(BytesIO(doc_raw)))
     c = count_doc(d)
     print(c.most_common())
+
+
+def test_count_doc_orders():
+    counters = count_doc_orders(txt, 3)
+    assert 3 == len(counters)
+    for size, counter in enumerate(counters, 1):
+        assert count_doc(txt, size) == counter
+
+
+texts = [
+    "Je mange des carottes. Tu manges des petits pois.",
+    "Je mange des petits pois.",
+    "Il mange des carottes.",
+    "Nous mangeons des carottes et des petits pois.",
+]
+
+
+def loader(index: int, num_shards: int):
+    return texts[index::num_shards]
+
+
+def test_count_sharded():
+    with TemporaryDirectory() as temp:
+        target = Path(temp) / "loc"
+        stages = Stages(log=None)
+        count_sharded(target, loader, ngram_size=2, n_jobs=2, stages=stages)
+        assert not (target / "shards").exists()
+        report = stages.report()["stages"]
+        assert 4 == report["wiki"]["items"]
+        assert 4 == report["add_counter"]["calls"]
+        assert 2 == report["merge"]["calls"]
+        loc = LocutionsCold(target)
+        assert 4 == loc.total()
+        expected = Counter()
+        for txt in texts:
+            expected.update(count_doc(txt, 2))
+        assert expected["mange des"] == loc["mange des"][0]
+        assert 3 == loc["mange des"][1]
+        assert set(expected) == set(loc)
+
+
+@pytest.mark.parametrize("budget", [0, 1])
+def test_count_sharded_pruned(budget: int):
+    with TemporaryDirectory() as temp:
+        target = Path(temp) / "loc"
+        count_sharded(target, loader, ngram_size=2, n_jobs=2, budget=budget, min_df=2)
+        assert not list(target.glob("runs/*.tsv"))
+        loc = LocutionsCold(target)
+        assert 4 == loc.total()
+        expected = Counter()
+        for txt in texts:
+            expected.update(count_doc(txt, 2).keys())
+        assert {k for k, df in expected.items() if df >= 2} == set(loc)
+        assert (3, 3) == loc["mange des"]
@@ -0,0 +1,236 @@
+import math
+from pathlib import Path
+from typing import Generator, Iterable, Sequence
+
+import numpy as np
+
+from locutions import Locutions
+from nlp import tokenize
+
+
+def load_codes(path: Path, dtype, mapped: bool = False) -> np.ndarray:
+    "Read a numpy vector file, memory-mapped or not"
+    if not path.exists() or path.lstat().st_size == 0:
+        return np.zeros(0, dtype=dtype)
+    if mapped:
+        return np.memmap(path, dtype=dtype, mode="r")
+    return np.fromfile(path, dtype=dtype)
+
+
+def write_codes(path: Path, values: np.ndarray):
+    "Replace a numpy vector file, readers mapping the old file still see it"
+    tmp = path.with_suffix(".tmp")
+    values.tofile(tmp)
+    tmp.replace(path)
+
+
+def empty_counts() -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    "No codes, no tf, no df"
+    return (
+        np.zeros(0, dtype=np.uint64),
+        np.zeros(0, dtype=np.uint32),
+        np.zeros(0, dtype=np.uint32),
+    )
+
+
+def merge_counts(
+    codes: Sequence[np.ndarray], tf: Sequence[np.ndarray], df: Sequence[np.ndarray]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    "Sum counts of codes, return sorted unique codes with their tf and df"
+    u, inverse = np.unique(np.concatenate(codes), return_inverse=True)
+    tf = np.bincount(inverse, weights=np.concatenate(tf), minlength=len(u))
+    df = np.bincount(inverse, weights=np.concatenate(df), minlength=len(u))
+    return u, tf.astype(np.uint32), df.astype(np.uint32)
+
+
+class PackedLocutions:
+    """
+    Ngrams store, keyed by unigram positions.
+    Unigrams are counted in a Locutions store, in the words folder. An ngram is
+    the tuple of its unigram positions, packed in an uint64 (2 x 32 bits for
+    bigrams, 3 x 21 bits for trigrams), codes are sorted with their tf and df.
+    Pending counts are kept as numpy vectors, and summed when reading or writing.
+    """
+
+    words: Locutions
+    size: int
+    bits: int
+    codes: np.ndarray
+    tf: np.ndarray
+    df: np.ndarray
+
+    def __init__(
+        self, folder: str | Path, size: int = 2, create: bool = False, mapped=False
+    ):
+        if isinstance(folder, str):
+            folder = Path(folder)
+        if not folder.exists():
+            if not create:
+                raise FileNotFoundError(f"Folder not found {folder}")
+            folder.mkdir()
+        self.size = size
+        self.bits = 64 // size
+        self.words = Locutions(folder / "words", create=True, mapped=mapped)
+        self.f_codes = folder / "codes.bin"
+        self.f_tf = folder / "tf.bin"
+        self.f_df = folder / "df.bin"
+        self.codes = load_codes(self.f_codes, np.uint64, mapped)
+        self.tf = load_codes(self.f_tf, np.uint32, mapped)
+        self.df = load_codes(self.f_df, np.uint32, mapped)
+        self._new = [], []
+        self._pending = empty_counts()
+
+    def pack(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Codes of all the ngrams of a sentence, from its unigram positions.
+        Like nlp.ngram, the last window is not used.
+        """
+        n = len(ids) - self.size
+        if n <= 0:
+            return np.zeros(0, dtype=np.uint64)
+        if ids.max() >> self.bits:
+            raise OverflowError(
+                f"{len(self.words)} words don't fit in {self.bits} bits ngrams"
+            )
+        codes = np.zeros(n, dtype=np.uint64)
+        for j in range(self.size):
+            codes <<= np.uint64(self.bits)
+            codes |= ids[j : j + n]
+        return codes
+
+    def unpack(self, codes: np.ndarray) -> np.ndarray:
+        "Unigram positions of codes, one column per word"
+        mask = np.uint64((1 << self.bits) - 1)
+        shifts = [np.uint64(self.bits * (self.size - 1 - j)) for j in range(self.size)]
+        return np.stack([(codes >> s) & mask for s in shifts], axis=1)
+
+    def add_document(self, sentences: Iterable[list[str]]):
+        "Add a tokenized document, a list of sentences"
+        sentences = [s for s in sentences]
+        ids = np.array(
+            self.words.add_document(t for s in sentences for t in s), dtype=np.uint64
+        )
+        codes = []
+        start = 0
+        for sentence in sentences:
+            codes.append(self.pack(ids[start : start + len(sentence)]))
+            start += len(sentence)
+        codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.uint64)
+        self._new[0].append(codes)
+        self._new[1].append(np.unique(codes))
+        if sum(len(c) for c in self._new[0]) > 1 << 20:
+            self._merge_new()
+
+    def add_text(self, txt: str, segmenter: str = "pysbd"):
+        "Tokenize a text, and add it"
+        self.add_document(tokenize(txt, segmenter))
+
+    def _merge_new(self):
+        "Sum new ngrams with the pending counts"
+        tf, df = self._new
+        if not tf:
+            return
+        codes = np.concatenate(tf)
+        uniques = np.concatenate(df)
+        p_codes, p_tf, p_df = self._pending
+        self._pending = merge_counts(
+            (p_codes, codes, uniques),
+            (p_tf, np.ones(len(codes), np.uint32), np.zeros(len(uniques), np.uint32)),
+            (p_df, np.zeros(len(codes), np.uint32), np.ones(len(uniques), np.uint32)),
+        )
+        self._new = [], []
+
+    def _find(self, codes: np.ndarray, sorted_codes: np.ndarray) -> np.ndarray:
+        "Positions of codes in sorted codes, -1 when missing"
+        if len(sorted_codes) == 0:
+            return np.full(len(codes), -1, dtype=np.int64)
+        pos = np.searchsorted(sorted_codes, codes)
+        pos[pos == len(sorted_codes)] = 0
+        return np.where(sorted_codes[pos] == codes, pos, -1)
+
+    def encode(self, keys: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+        "Codes of space joined ngrams, with a mask of the ngrams made of known words"
+        tokens = [k.split(" ") for k in keys]
+        found = np.array([len(t) == self.size for t in tokens], dtype=bool)
+        flat = [w for t, ok in zip(tokens, found) for w in t if ok]
+        ids = self.words.ords_many(flat).reshape(-1, self.size)
+        known = (ids >= 0).all(axis=1)
+        found[found] = known
+        ids = ids[known].astype(np.uint64)
+        codes = np.zeros(len(keys), dtype=np.uint64)
+        packed = np.zeros(len(ids), dtype=np.uint64)
+        for j in range(self.size):
+            packed <<= np.uint64(self.bits)
+            packed |= ids[:, j]
+        codes[found] = packed
+        return codes, found
+
+    def get_many(
+        self, keys: Sequence[str]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        "tf, df and found mask of a batch of keys, missing keys count 0"
+        if not isinstance(keys, Sequence):
+            keys = list(keys)
+        self._merge_new()
+        codes, found = self.encode(keys)
+        tf = np.zeros(len(keys), dtype=np.int64)
+        df = np.zeros(len(keys), dtype=np.int64)
+        hit = np.zeros(len(keys), dtype=bool)
+        for s_codes, s_tf, s_df in ((self.codes, self.tf, self.df), self._pending):
+            pos = self._find(codes, s_codes)
+            ok = found & (pos >= 0)
+            tf[ok] += s_tf[pos[ok]]
+            df[ok] += s_df[pos[ok]]
+            hit |= ok
+        return tf, df, hit
+
+    def __getitem__(self, key: str) -> tuple[int, int]:
+        tf, df, found = self.get_many([key])
+        if not found[0]:
+            raise KeyError(key)
+        return int(tf[0]), int(df[0])
+
+    def __contains__(self, key: str) -> bool:
+        return bool(self.get_many([key])[2][0])
+
+    def __len__(self) -> int:
+        self._merge_new()
+        return len(np.union1d(self.codes, self._pending[0]))
+
+    def total(self) -> int:
+        return self.words.total()
+
+    def tf_idf(self, key: str) -> float:
+        tf, df = self[key]
+        return tf * math.log(float(self.total()) / df)
+
+    def items(self) -> Generator[tuple[str, tuple[int, int]], None, None]:
+        "Ngrams and their counts, in code order"
+        self._merge_new()
+        codes, tf, df = merge_counts(
+            (self.codes, self._pending[0]),
+            (self.tf, self._pending[1]),
+            (self.df, self._pending[2]),
+        )
+        words = list(self.words)
+        for ids, t, d in zip(self.unpack(codes), tf, df):
+            yield " ".join(words[i] for i in ids), (int(t), int(d))
+
+    def __iter__(self) -> Generator[str, None, None]:
+        for k, _ in self.items():
+            yield k
+
+    def write(self):
+        "Sum pending counts in the store, and write it"
+        self._merge_new()
+        codes, tf, df = merge_counts(
+            (self.codes, self._pending[0]),
+            (self.tf, self._pending[1]),
+            (self.df, self._pending[2]),
+        )
+        self.words.write()
+        write_codes(self.f_codes, codes)
+        write_codes(self.f_tf, tf)
+        write_codes(self.f_df, df)
+        self.codes, self.tf, self.df = codes, tf, df
+        self._pending = empty_counts()
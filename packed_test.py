@@ -0,0 +1,58 @@
+from collections import Counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from nlp import ngram
+from packed import PackedLocutions
+
+docs = [
+    [["je", "mange", "des", "petits", "pois", "."]],
+    [
+        ["tu", "manges", "des", "petits", "pois", "."],
+        ["je", "mange", "des", "carottes", "."],
+    ],
+]
+
+
+def expected(size: int) -> Counter:
+    c = Counter()
+    for doc in docs:
+        for sentence in doc:
+            c.update(" ".join(n) for n in ngram(sentence, size))
+    return c
+
+
+def test_pack():
+    with TemporaryDirectory() as temp:
+        loc = PackedLocutions(Path(temp) / "loc", size=3, create=True)
+        ids = np.array([1, 2, 3, 4], dtype=np.uint64)
+        codes = loc.pack(ids)
+        assert 1 == len(codes)
+        assert [[1, 2, 3]] == loc.unpack(codes).tolist()
+
+
+def test_packed():
+    with TemporaryDirectory() as temp:
+        loc = PackedLocutions(Path(temp) / "loc", create=True)
+        for doc in docs:
+            loc.add_document(doc)
+        assert (2, 2) == loc["des petits"]
+        assert (2, 2) == loc["mange des"]
+        assert "petits pois" in loc
+        assert "pois chiches" not in loc
+        assert dict(expected(2)) == {k: v[0] for k, v in loc.items()}
+        loc.write()
+        assert 2 == loc.total()
+
+        again = PackedLocutions(Path(temp) / "loc", mapped=True)
+        assert (2, 2) == again["des petits"]
+        again.add_document([["des", "petits", "pois", "chiches", "."]])
+        tf, df, found = again.get_many(
+            ["des petits", "pois chiches", "je mange", "x y"]
+        )
+        assert [3, 1, 2, 0] == list(tf)
+        assert [3, 1, 2, 0] == list(df)
+        assert [True, True, True, False] == list(found)
+        assert 0 < again.tf_idf("pois chiches")
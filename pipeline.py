@@ -0,0 +1,201 @@
+#! /usr/bin/env python
+"""
+Pipelined ingest of a Wikipedia abstract dump in a Locutions store.
+A thread decompresses and parses the dump, a process pool tokenizes and
+counts batches of texts, the main thread adds the counts in order.
+Stages are connected by bounded queues, a slow stage holds back the others.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Iterable
+
+from instrument import Stages
+from locutions import Locutions, MultiLocutions
+from nlp import locutions, multi_locutions
+from wiki_abstract import wiki
+
+END = None
+
+n_cores: int
+try:
+    n_cores = len(os.sched_getaffinity(0))
+except AttributeError:  # macOS and Windows
+    n_cores = os.cpu_count()
+
+
+def count_batch(
+    texts: list[str], ngram_size: int = 2, segmenter: str = "regex"
+) -> tuple[Counter, Counter, int]:
+    "tf and df of the ngrams of a batch of texts, and its size, in a worker"
+    tf = Counter()
+    df = Counter()
+    for txt in texts:
+        count = Counter(" ".join(l) for l in locutions(txt, ngram_size, segmenter))
+        tf.update(count)
+        df.update(count.keys())
+    return tf, df, len(texts)
+
+
+def count_batch_orders(
+    texts: list[str], max_size: int = 3, segmenter: str = "regex"
+) -> tuple[list[Counter], list[Counter], int]:
+    "tf and df of the ngrams of every size, from 1 to max_size, of a batch of texts"
+    tfs = [Counter() for _ in range(max_size)]
+    dfs = [Counter() for _ in range(max_size)]
+    for txt in texts:
+        counts = [Counter() for _ in range(max_size)]
+        for size, l in multi_locutions(txt, max_size, segmenter):
+            counts[size - 1][" ".join(l)] += 1
+        for tf, df, count in zip(tfs, dfs, counts):
+            tf.update(count)
+            df.update(count.keys())
+    return tfs, dfs, len(texts)
+
+
+def read(texts: Iterable[str], batches: queue.Queue, size: int, stop: threading.Event):
+    "Put batches of texts in a queue, in a thread, an exception ends the stream"
+    batch = []
+    try:
+        for txt in texts:
+            if stop.is_set():
+                return
+            batch.append(txt)
+            if len(batch) == size:
+                batches.put(batch)
+                batch = []
+        if batch:
+            batches.put(batch)
+        batches.put(END)
+    except Exception as e:  # handed to the consumer
+        batches.put(e)
+
+
+def ingest_texts(
+    texts: Iterable[str],
+    folder: Path,
+    ngram_size: int = 2,
+    segmenter: str = "regex",
+    workers: int = 0,
+    batch: int = 256,
+    flush: int = 50_000,
+    stages: Stages | None = None,
+    max_size: int = 0,
+) -> Locutions | MultiLocutions:
+    """
+    Count texts in a store, with a pool of workers.
+    With max_size, ngrams of every size from 1 to max_size are counted in a
+    MultiLocutions store, instead of the ngrams of ngram_size.
+    At most 2 batches per worker are read ahead, and 2 per worker are counted
+    ahead, counts are added in the order of the texts.
+    Flushes commit the number of counted texts, an interrupted ingest of the same
+    texts resumes after them.
+    """
+    if workers == 0:
+        workers = max(1, n_cores - 1)
+    if stages is None:
+        stages = Stages(log=None)
+    if max_size:
+        store = MultiLocutions(folder, max_size, create=True)
+        count, size = count_batch_orders, max_size
+    else:
+        store = Locutions(folder, create=True)
+        count, size = count_batch, ngram_size
+    checkpoint = store.resume() or dict(documents=0)
+    documents = checkpoint["documents"]
+    texts = islice(texts, documents, None)
+    batches = queue.Queue(maxsize=2 * workers)
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=read, args=(texts, batches, batch, stop), daemon=True
+    )
+    reader.start()
+    pending: deque[Future] = deque()
+    flushed = documents
+    try:
+        # workers start on demand, forking them would copy the reader thread locks
+        context = multiprocessing.get_context("forkserver")
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            done = False
+            while not done or pending:
+                while not done and len(pending) < 2 * workers:
+                    with stages.stage("read"):
+                        texts = batches.get()
+                    if isinstance(texts, Exception):
+                        raise texts
+                    if texts is END:
+                        done = True
+                        break
+                    pending.append(pool.submit(count, texts, size, segmenter))
+                if not pending:
+                    break
+                with stages.stage("count"):
+                    tf, df, n = pending.popleft().result()
+                with stages.stage("add_batch", n):
+                    store.add_batch(tf, df, n)
+                documents += n
+                if documents - flushed >= flush:
+                    with stages.stage("flush"):
+                        store.flush(checkpoint=dict(documents=documents))
+                    flushed = documents
+    finally:
+        stop.set()
+        while reader.is_alive():  # unblock the reader
+            try:
+                batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    with stages.stage("write"):
+        store.write(checkpoint=dict(documents=documents))
+    return store
+
+
+def ingest(dump: Path | str, folder: Path, **kwargs) -> Locutions | MultiLocutions:
+    "Count the abstracts of a dump, see ingest_texts"
+    return ingest_texts(
+        (doc.abstract for doc in wiki(dump, fast=True)), folder, **kwargs
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("dump", help="xml, xml.gz or xml.zst dump, - for STDIN")
+    parser.add_argument("store", type=Path)
+    parser.add_argument("--size", type=int, default=2, help="ngram size")
+    parser.add_argument("--segmenter", default="regex")
+    parser.add_argument("--workers", type=int, default=0, help="0 means all cores")
+    parser.add_argument("--batch", type=int, default=256, help="texts per task")
+    parser.add_argument(
+        "--max-size",
+        type=int,
+        default=0,
+        help="count every size up to this one, in a MultiLocutions store",
+    )
+    args = parser.parse_args()
+
+    stages = Stages(interval=30)
+    ingest(
+        args.dump,
+        args.store,
+        ngram_size=args.size,
+        segmenter=args.segmenter,
+        workers=args.workers,
+        batch=args.batch,
+        stages=stages,
+        max_size=args.max_size,
+    )
+    stages.write_log()
+    if args.max_size:
+        store = MultiLocutions(args.store, args.max_size)
+        print(f"{sum(map(len, store.orders))} locutions", file=sys.stderr)
+    else:
+        print(f"{len(Locutions(args.store))} locutions", file=sys.stderr)
@@ -0,0 +1,81 @@
+import gzip
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from bench import corpus, dump
+from locutions import Locutions, LocutionsCold, MultiLocutions
+from pipeline import count_batch, ingest, ingest_texts
+
+texts = list(corpus(300, vocabulary_size=500))
+
+
+def test_ingest():
+    with TemporaryDirectory() as temp:
+        path = Path(temp) / "dump.xml.gz"
+        with gzip.open(path, "wb") as f:
+            f.write(dump(texts))
+        store = ingest(path, Path(temp) / "loc", workers=2, batch=16, flush=100)
+        expected = Locutions(Path(temp) / "expected", create=True)
+        for txt in texts:
+            tf, _, _ = count_batch([txt])
+            expected.add_counter(tf)
+        assert expected.total() == store.total() == 300
+        cold = LocutionsCold(Path(temp) / "loc")
+        assert set(expected) == set(cold)
+        for key in list(expected)[:200]:
+            assert expected[key] == cold[key]
+
+
+def test_order():
+    with TemporaryDirectory() as temp:
+        store = ingest_texts(
+            ["Un deux trois quatre.", "Cinq six sept huit."] * 3,
+            Path(temp) / "loc",
+            workers=2,
+            batch=1,
+        )
+        assert ["un deux", "deux trois", "cinq six", "six sept"] == list(store)
+
+
+def test_reader_error():
+    def texts():
+        yield "Un deux trois quatre."
+        raise ValueError("broken dump")
+
+    with TemporaryDirectory() as temp:
+        with pytest.raises(ValueError):
+            ingest_texts(texts(), Path(temp) / "loc", workers=1, batch=1)
+
+
+def test_resume():
+    def interrupted():
+        yield from texts[:150]
+        raise ValueError("broken dump")
+
+    with TemporaryDirectory() as temp:
+        folder = Path(temp) / "loc"
+        with pytest.raises(ValueError):
+            ingest_texts(interrupted(), folder, workers=1, batch=10, flush=40)
+        assert 120 == LocutionsCold(folder).checkpoint()["documents"]
+        store = ingest_texts(texts, folder, workers=1, batch=10, flush=40)
+        expected = ingest_texts(texts, Path(temp) / "expected", workers=1)
+        assert expected.total() == store.total() == 300
+        assert set(expected) == set(store)
+        for key in list(expected)[:200]:
+            assert expected[key] == store[key]
+
+
+def test_max_size():
+    with TemporaryDirectory() as temp:
+        store = ingest_texts(
+            texts[:50], Path(temp) / "multi", workers=1, batch=8, max_size=2
+        )
+        multi = MultiLocutions(Path(temp) / "multi", max_size=2)
+        for size in (1, 2):
+            tf, df, n = count_batch(texts[:50], size)
+            assert n == store.order(size).total() == multi.order(size).total()
+            assert set(tf) == set(multi.order(size))
+            for key in list(tf)[:100]:
+                assert (tf[key], df[key]) == multi[key]
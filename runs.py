@@ -0,0 +1,39 @@
+"""
+Sorted runs of counted keys, for external sorting.
+A run is a text file, one "key\\ttf\\tdf" line per key, sorted by key.
+Keys are ngrams of tokens, they can't hold tabs or new lines.
+"""
+
+import heapq
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+from typing import Generator, Iterable
+
+Counts = tuple[str, int, int]
+
+
+def write_run(path: Path, items: Iterable[Counts]):
+    "Write sorted counts, the file is renamed when complete"
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf8") as f:
+        for key, tf, df in items:
+            f.write(f"{key}\t{tf}\t{df}\n")
+    tmp.replace(path)
+
+
+def read_run(path: Path) -> Generator[Counts, None, None]:
+    with path.open("r", encoding="utf8") as f:
+        for line in f:
+            key, tf, df = line[:-1].split("\t")
+            yield key, int(tf), int(df)
+
+
+def merge_runs(runs: Iterable[Iterable[Counts]]) -> Generator[Counts, None, None]:
+    "Merge sorted runs, counts of the same key are summed"
+    for key, group in groupby(heapq.merge(*runs, key=itemgetter(0)), itemgetter(0)):
+        tf = df = 0
+        for _, t, d in group:
+            tf += t
+            df += d
+        yield key, tf, df
@@ -0,0 +1,19 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from runs import merge_runs, read_run, write_run
+
+
+def test_runs():
+    with TemporaryDirectory() as temp:
+        a = Path(temp) / "a.tsv"
+        b = Path(temp) / "b.tsv"
+        write_run(a, [("des", 2, 1), ("je mange", 1, 1), ("pois", 1, 1)])
+        write_run(b, [("carottes", 1, 1), ("des", 3, 2)])
+        assert [("carottes", 1, 1), ("des", 3, 2)] == list(read_run(b))
+        assert [
+            ("carottes", 1, 1),
+            ("des", 5, 3),
+            ("je mange", 1, 1),
+            ("pois", 2, 2),
+        ] == list(merge_runs([read_run(a), read_run(b), iter([("pois", 1, 1)])]))
@@ -0,0 +1,189 @@
+#! /usr/bin/env python
+"""
+Resident scoring server: the store is opened once, and reopened when it changes.
+Clients send JSON lines, {"texts": [...]} and get one JSON line back,
+{"results": [{"ngrams": [...], "scores": [...], "unknown": [...]}, ...]}
+"""
+
+import asyncio
+import json
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from compiled import Compiled, compile_store
+from db import Db
+from locutions import CURRENT, LocutionsCold, snapshot
+from nlp import locutions
+
+
+def open_store(path: Path) -> LocutionsCold | Compiled:
+    "A Locutions store or a compiled file, read only, a Db is compiled"
+    if path.is_file():
+        return Compiled(path)
+    if (path / "db").exists():
+        return compile_db(path)
+    return LocutionsCold(path, mapped=True)
+
+
+def compile_db(path: Path) -> Compiled:
+    """
+    Compile a Db in its folder, as compiled.bin, and open it.
+    leveldb is locked only while compiling, an ingest can run meanwhile.
+    """
+    db = Db(path, read_only=True)
+    try:
+        compile_store(db, path / "compiled.bin")
+    finally:
+        db.close()
+    return Compiled(path / "compiled.bin")
+
+
+def stamp(path: Path) -> tuple:
+    "Changes when a store is written or flushed"
+    if path.is_file():  # compiled stores are replaced
+        return (path.stat().st_mtime_ns,)
+    current = snapshot(path)
+    files = [
+        path / "COMMIT",
+        path / "docs",
+        path / CURRENT,
+        current / "total.bin",
+        current / "segments",
+    ]
+    return tuple(f.stat().st_mtime_ns if f.exists() else 0 for f in files)
+
+
+class Scorer:
+    """
+    Scores ngrams of texts with a store.
+    The store is reopened, at most every interval seconds, when its files change.
+    A Db is served compiled, it is compiled again when it's committed, unless an
+    ingest holds its lock: the old one is served, and the next check retries.
+    Texts are tokenized concurrently, the store is used by one thread at a time.
+    """
+
+    path: Path
+    store: LocutionsCold | Compiled
+    size: int
+    segmenter: str
+    interval: float
+
+    def __init__(
+        self,
+        path: Path,
+        size: int = 2,
+        segmenter: str = "pysbd",
+        interval: float = 1.0,
+    ):
+        self.path = path
+        self.size = size
+        self.segmenter = segmenter
+        self.interval = interval
+        self._stamp = stamp(path)
+        self.store = open_store(path)
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reload(self) -> bool:
+        "Reopen the store if it changed"
+        now = time.monotonic()
+        if now - self._checked < self.interval:
+            return False
+        self._checked = now
+        current = stamp(self.path)
+        if current == self._stamp:
+            return False
+        try:
+            self.store = open_store(self.path)
+        except Exception as e:  # the old store is served meanwhile
+            print(f"Can't reopen {self.path}: {type(e).__name__}: {e}", file=sys.stderr)
+            return False
+        self._stamp = current
+        return True
+
+    def score(self, texts: Iterable[str]) -> list[dict]:
+        "Scores and unknown flags of the ngrams of each text, in one batch"
+        ngrams = [
+            [" ".join(l) for l in locutions(txt, self.size, self.segmenter)]
+            for txt in texts
+        ]
+        keys = [k for n in ngrams for k in n]
+        with self._lock:
+            self.reload()
+            scores, found = self.store.tf_idf_many(keys)
+        bounds = np.cumsum([0] + [len(n) for n in ngrams]).tolist()
+        return [
+            dict(
+                ngrams=n,
+                scores=scores[start:end].tolist(),
+                unknown=(~found[start:end]).tolist(),
+            )
+            for n, start, end in zip(ngrams, bounds, bounds[1:])
+        ]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        "One client, one request per line, until it disconnects"
+        try:
+            while line := await reader.readline():
+                try:
+                    texts = json.loads(line)["texts"]
+                    response = dict(results=await asyncio.to_thread(self.score, texts))
+                except (ValueError, KeyError, TypeError, OSError) as e:
+                    response = dict(error=f"{type(e).__name__}: {e}")
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+async def serve(
+    scorer: Scorer,
+    unix: Path | None = None,
+    host: str = "127.0.0.1",
+    port: int = 8421,
+) -> asyncio.Server:
+    "Listen on a Unix socket, or on a local TCP port"
+    if unix is not None:
+        return await asyncio.start_unix_server(scorer.handle, path=unix)
+    return await asyncio.start_server(scorer.handle, host, port)
+
+
+def score(unix: Path, texts: list[str]) -> list[dict]:
+    "Ask a server listening on a Unix socket"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(str(unix))
+        s.sendall(json.dumps(dict(texts=texts)).encode() + b"\n")
+        with s.makefile("rb") as f:
+            response = json.loads(f.readline())
+    if "error" in response:
+        raise ValueError(response["error"])
+    return response["results"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("store", type=Path, nargs="?", default=Path("./fresh.loc"))
+    parser.add_argument("--unix", type=Path, help="Unix socket, instead of TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8421)
+    parser.add_argument("--size", type=int, default=2, help="ngram size")
+    parser.add_argument(
+        "--segmenter", default="pysbd", help="sentence segmenter, the one of the ingest"
+    )
+    args = parser.parse_args()
+
+    async def main():
+        scorer = Scorer(args.store, args.size, args.segmenter)
+        server = await serve(scorer, args.unix, args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import math
+from collections import Counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from compiled import compile_store
+from db import Db
+from locutions import Locutions, LocutionsCold
+from server import Scorer, score, serve
+
+
+async def ask(unix: Path, request: dict) -> dict:
+    reader, writer = await asyncio.open_unix_connection(unix)
+    writer.write(json.dumps(request).encode() + b"\n")
+    response = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+    return response
+
+
+def test_server():
+    with TemporaryDirectory() as temp:
+        folder = Path(temp) / "loc"
+        loc = Locutions(folder, create=True)
+        loc.add_counter(Counter(["je mange", "mange des", "des carottes"]))
+        loc.add_counter(Counter(["je mange", "mange des", "des pois"]))
+        loc.write()
+        scorer = Scorer(folder, interval=0)
+        unix = Path(temp) / "fresh.sock"
+
+        async def main():
+            server = await serve(scorer, unix)
+            async with server:
+                first, second, bad = await asyncio.gather(
+                    ask(unix, dict(texts=["Je mange des carottes crues."])),
+                    ask(
+                        unix,
+                        dict(texts=["Des pois verts.", "Je mange des navets crus."]),
+                    ),
+                    ask(unix, dict(text="oops")),
+                )
+                [result] = first["results"]
+                assert ["je mange", "mange des", "des carottes"] == result["ngrams"]
+                assert [0.0, 0.0, math.log(2)] == result["scores"]
+                assert [False, False, True] == second["results"][1]["unknown"]
+                assert "KeyError" in bad["error"]
+
+                loc.add_counter(Counter(["des navets"]))
+                loc.flush()
+                again = await ask(unix, dict(texts=["Je mange des navets crus."]))
+                assert [False, False, False] == again["results"][0]["unknown"]
+                results = await asyncio.to_thread(score, unix, ["Des navets crus."])
+                assert [False] == results[0]["unknown"]
+
+        asyncio.run(main())
+
+
+def test_db():
+    with TemporaryDirectory() as temp:
+        d = Db(temp)
+        d.add_doc(Counter(["je mange", "mange des"]))
+        d.add_doc(Counter(["je mange"]))
+        d.write()
+        d.close()
+        scorer = Scorer(Path(temp))
+        [result] = scorer.score(["Je mange des carottes crues."])
+        assert [False, False, True] == result["unknown"]
+
+
+def test_db_locked():
+    with TemporaryDirectory() as temp:
+        d = Db(temp)
+        d.add_doc(Counter(["je mange"]))
+        d.write()
+        d.close()
+        scorer = Scorer(Path(temp), interval=0)
+        writer = Db(temp)  # the scorer doesn't hold the lock
+        writer.add_doc(Counter(["mange des"]))
+        writer.write()
+        [result] = scorer.score(["Je mange des carottes crues."])
+        assert [False, True, True] == result["unknown"], "the old store is served"
+        writer.close()
+        [result] = scorer.score(["Je mange des carottes crues."])
+        assert [False, False, True] == result["unknown"]
+
+
+def test_compiled():
+    with TemporaryDirectory() as temp:
+        loc = Locutions(Path(temp) / "loc", create=True)
+        loc.add_counter(Counter(["je mange", "mange des"]))
+        loc.write()
+        compile_store(loc, Path(temp) / "loc.bin")
+        scorer = Scorer(Path(temp) / "loc.bin", interval=0)
+        [result] = scorer.score(["Je mange des carottes crues."])
+        assert [False, False, True] == result["unknown"]
+        loc.add_counter(Counter(["des carottes"]))
+        loc.write()
+        compile_store(LocutionsCold(Path(temp) / "loc"), Path(temp) / "loc.bin")
+        assert scorer.reload()
+        [result] = scorer.score(["Je mange des carottes crues."])
+        assert [False, False, False] == result["unknown"]
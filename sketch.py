@@ -0,0 +1,114 @@
+import hashlib
+import math
+from array import array
+from collections import Counter
+from typing import Iterable
+
+from locutions import Locutions
+
+
+class CountMinSketch:
+    """
+    Approximate counter with a fixed memory: depth rows of width int32 counters.
+    An estimate is never below the true count. With N the sum of all counts,
+    it is above it by at most epsilon * N with probability 1 - delta,
+    where epsilon = e / width and delta = exp(-depth).
+    Counters are updated conservatively, which only lowers the error.
+    """
+
+    width: int
+    depth: int
+    table: list[array]
+
+    def __init__(self, width: int = 1 << 22, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = [array("I", bytes(4 * width)) for _ in range(depth)]
+
+    @classmethod
+    def from_error(cls, epsilon: float, delta: float):
+        "Smallest sketch with this error bound"
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)))
+
+    @property
+    def nbytes(self) -> int:
+        return 4 * self.width * self.depth
+
+    def _cells(self, key: str) -> list[int]:
+        "One column per row, from a single hash"
+        digest = hashlib.blake2b(
+            key.encode("utf8"), digest_size=4 * self.depth
+        ).digest()
+        return [
+            int.from_bytes(digest[4 * i : 4 * i + 4], "little") % self.width
+            for i in range(self.depth)
+        ]
+
+    def add(self, key: str, n: int = 1) -> int:
+        "Count a key, return its new estimate"
+        cells = self._cells(key)
+        estimate = min(row[c] for row, c in zip(self.table, cells)) + n
+        for row, c in zip(self.table, cells):
+            if row[c] < estimate:
+                row[c] = estimate
+        return estimate
+
+    def __getitem__(self, key: str) -> int:
+        return min(row[c] for row, c in zip(self.table, self._cells(key)))
+
+
+class SketchedLocutions:
+    """
+    Locutions with an approximate tail, for a bounded memory.
+    Keys already in the store are counted exactly. Other keys are counted in
+    count-min sketches, for tf and df, and are promoted in the store once their
+    estimated tf reaches the threshold, with their estimated counts.
+    Promoted counts are overestimated by at most epsilon * N (see
+    CountMinSketch), keys whose tf stays below the threshold are never stored.
+    """
+
+    store: Locutions
+    threshold: int
+    tf: CountMinSketch
+    df: CountMinSketch
+
+    def __init__(
+        self,
+        store: Locutions,
+        threshold: int = 5,
+        width: int = 1 << 22,
+        depth: int = 4,
+    ):
+        self.store = store
+        self.threshold = threshold
+        self.tf = CountMinSketch(width, depth)
+        self.df = CountMinSketch(width, depth)
+
+    def add_counter(self, words: Counter) -> int:
+        "Add a Counter of words, return the number of promoted words"
+        exact = Counter()
+        promoted = 0
+        for word, n in words.items():
+            if word in self.store:
+                exact[word] = n
+                continue
+            tf = self.tf.add(word, n)
+            df = self.df.add(word)
+            if tf >= self.threshold:
+                self.store.add(word, tf, df)
+                promoted += 1
+        self.store.add_counter(exact)
+        return promoted
+
+    def add_document(self, words: Iterable[str]) -> int:
+        "Add a document for word counting, return the number of promoted words"
+        return self.add_counter(Counter(words))
+
+    def __getitem__(self, word: str) -> tuple[int, int]:
+        "Exact counts of stored words, estimates for the others"
+        if word in self.store:
+            return self.store[word]
+        return self.tf[word], self.df[word]
+
+    def total(self) -> int:
+        return self.store.total()
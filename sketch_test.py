@@ -0,0 +1,46 @@
+import math
+import random
+from collections import Counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from locutions import Locutions
+from sketch import CountMinSketch, SketchedLocutions
+
+
+def test_count_min():
+    random.seed(42)
+    sketch = CountMinSketch(width=1024, depth=4)
+    truth = Counter(f"w{int(random.paretovariate(1))}" for _ in range(20_000))
+    for key, n in truth.items():
+        sketch.add(key, n)
+    bound = math.e / sketch.width * truth.total()
+    for key, n in truth.items():
+        assert n <= sketch[key] <= n + bound
+    assert 0 <= sketch["unknown"] <= bound
+    assert 4 * 1024 * 4 == sketch.nbytes
+
+
+def test_from_error():
+    sketch = CountMinSketch.from_error(0.001, 0.01)
+    assert 2719 == sketch.width
+    assert 5 == sketch.depth
+
+
+def test_sketched():
+    with TemporaryDirectory() as temp:
+        store = Locutions(Path(temp) / "test", create=True)
+        loc = SketchedLocutions(store, threshold=3, width=1024)
+        assert 0 == loc.add_document(["je", "mange", "des", "des"])
+        assert "des" not in store
+        assert 1 == loc.add_document(["des", "pois", "je"])
+        assert (3, 2) == store["des"]
+        assert "je" not in store
+        assert (1, 1) == loc["pois"]
+        assert 1 == loc.add_document(["des", "carottes", "je"])
+        assert (4, 3) == store["des"]
+        assert (3, 3) == store["je"]
+        assert "carottes" not in store
+        assert 3 == loc.total()
+        store.write()
+        assert (4, 3) == store["des"]
@@ -0,0 +1,239 @@
+import os
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from locutions import Locutions
+
+
+class Bucket:
+    """
+    Counts of a time bucket, sparse: sorted positions with their tf and df.
+    Added documents are summed when the counts are read.
+    """
+
+    ids: np.ndarray
+    tf: np.ndarray
+    df: np.ndarray
+    docs: int
+
+    def __init__(self, ids=None, tf=None, df=None, docs: int = 0):
+        self.ids = np.zeros(0, dtype=np.int64) if ids is None else ids
+        self.tf = np.zeros(0, dtype=np.uint32) if tf is None else tf
+        self.df = np.zeros(0, dtype=np.uint32) if df is None else df
+        self.docs = docs
+        self._new = []
+
+    def add(self, ids: np.ndarray, tf: np.ndarray):
+        "Add a document, its positions are unique"
+        self._new.append((ids, tf))
+        self.docs += 1
+
+    def counts(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        "Sorted positions, tf and df"
+        if self._new:
+            ids = np.concatenate([self.ids] + [i for i, _ in self._new])
+            tf = np.concatenate([self.tf] + [t for _, t in self._new])
+            df = np.concatenate(
+                [self.df] + [np.ones(len(i), np.uint32) for i, _ in self._new]
+            )
+            self.ids, inverse = np.unique(ids, return_inverse=True)
+            self.tf = np.bincount(inverse, tf, len(self.ids)).astype(np.uint32)
+            self.df = np.bincount(inverse, df, len(self.ids)).astype(np.uint32)
+            self._new = []
+        return self.ids, self.tf, self.df
+
+    def get(self, idx: int) -> tuple[int, int]:
+        ids, tf, df = self.counts()
+        i = np.searchsorted(ids, idx)
+        if i == len(ids) or ids[i] != idx:
+            return 0, 0
+        return int(tf[i]), int(df[i])
+
+
+class TimedLocutions:
+    """
+    Locutions counted by time bucket, for horodated feeds.
+    All time counts are kept in a Locutions store, which gives positions to keys.
+    Counts of the last buckets are kept in a ring of sparse buckets, using the
+    same positions, so recent counts can be compared with the all time baseline.
+    """
+
+    store: Locutions
+    bucket: int
+    size: int
+    head: int | None
+    ring: list[Bucket]
+
+    def __init__(
+        self,
+        folder: str | Path,
+        bucket: int = 3600,
+        size: int = 168,
+        create: bool = False,
+    ):
+        if isinstance(folder, str):
+            folder = Path(folder)
+        self.store = Locutions(folder, create=create)
+        self.folder = folder
+        self.head = None
+        self.bucket = bucket
+        self.size = size
+        self.ring = [Bucket() for _ in range(size)]
+        self.generation = 0
+        checkpoint = self.store.checkpoint()
+        if checkpoint and "ring" in checkpoint:
+            self.generation = int(checkpoint["ring"].split(".")[1])
+            with np.load(folder / checkpoint["ring"]) as ring:
+                head, self.bucket, self.size = (int(v) for v in ring["meta"])
+                self.head = None if head < 0 else head
+                self.ring = [
+                    Bucket(
+                        ring[f"ids_{i}"],
+                        ring[f"tf_{i}"],
+                        ring[f"df_{i}"],
+                        int(ring["docs"][i]),
+                    )
+                    for i in range(self.size)
+                ]
+
+    def _slot(self, timestamp: float) -> int | None:
+        "Ring slot of a timestamp, the ring moves forward, None when it's too old"
+        b = int(timestamp // self.bucket)
+        if self.head is None:
+            self.head = b
+        if b > self.head:
+            for old in range(max(self.head + 1, b - self.size + 1), b + 1):
+                self.ring[old % self.size] = Bucket()
+            self.head = b
+        if b <= self.head - self.size:
+            return None
+        return b % self.size
+
+    def add_document(self, words: Iterable[str], timestamp: float):
+        "Add a document, published at timestamp (in seconds)"
+        ids = self.store.add_document(words)
+        slot = self._slot(timestamp)
+        if slot is None:  # only in the all time counts
+            return
+        ids, tf = np.unique(np.array(ids, dtype=np.int64), return_counts=True)
+        self.ring[slot].add(ids, tf.astype(np.uint32))
+
+    def add_counter(self, words: Counter, timestamp: float):
+        "Add a Counter of words, published at timestamp (in seconds)"
+        ids = self.store.add_counter(words)
+        slot = self._slot(timestamp)
+        if slot is None:
+            return
+        self.ring[slot].add(
+            np.array(ids, dtype=np.int64),
+            np.fromiter(words.values(), dtype=np.uint32, count=len(words)),
+        )
+
+    def _weights(self, window: int | None, half_life: float | None) -> np.ndarray:
+        "Weight of each slot: 1 in the window of the last buckets, or a decay"
+        weights = np.zeros(self.size, dtype=np.float64)
+        if self.head is None:
+            return weights
+        if window is None:
+            window = self.size
+        age = np.arange(min(window, self.size))
+        slots = (self.head - age) % self.size
+        if half_life is None:
+            weights[slots] = 1.0
+        else:
+            weights[slots] = 0.5 ** (age / half_life)
+        return weights
+
+    def window_counts(
+        self, window: int | None = None, half_life: float | None = None
+    ) -> tuple[np.ndarray, np.ndarray, float]:
+        """
+        tf and df vectors, aligned with the store positions, and number of
+        documents, over the last window buckets.
+        With half_life (in buckets), counts are exponentially decayed.
+        """
+        weights = self._weights(window, half_life)
+        n = len(self.store)
+        tf = np.zeros(n, dtype=np.float64)
+        df = np.zeros(n, dtype=np.float64)
+        docs = 0.0
+        for weight, bucket in zip(weights, self.ring):
+            if weight == 0:
+                continue
+            ids, b_tf, b_df = bucket.counts()
+            tf[ids] += weight * b_tf
+            df[ids] += weight * b_df
+            docs += weight * bucket.docs
+        return tf, df, docs
+
+    def window(
+        self, key: str, window: int | None = None, half_life: float | None = None
+    ) -> tuple[float, float]:
+        "tf and df of a key over the last window buckets, or decayed"
+        idx = self.store.ord(key)
+        tf = df = 0.0
+        for weight, bucket in zip(self._weights(window, half_life), self.ring):
+            if weight == 0:
+                continue
+            b_tf, b_df = bucket.get(idx)
+            tf += weight * b_tf
+            df += weight * b_df
+        return tf, df
+
+    def __getitem__(self, key: str) -> tuple[int, int]:
+        "All time tf and df"
+        return self.store[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.store
+
+    def total(self) -> int:
+        "All time number of documents"
+        return self.store.total()
+
+    def _save_ring(self) -> str:
+        """
+        Write the ring in a new file, before the store commit which names it in
+        its checkpoint: the ring and the all time counts are committed together.
+        """
+        self.generation += 1
+        name = f"ring.{self.generation:06d}.npz"
+        head = -1 if self.head is None else self.head
+        arrays = {
+            "meta": np.array([head, self.bucket, self.size], dtype=np.int64),
+            "docs": np.array([b.docs for b in self.ring], dtype=np.uint32),
+        }
+        for i, bucket in enumerate(self.ring):
+            arrays[f"ids_{i}"], arrays[f"tf_{i}"], arrays[f"df_{i}"] = bucket.counts()
+        tmp = self.folder / f"{name}.tmp"
+        with tmp.open("wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.folder / name)
+        return name
+
+    def _retire_rings(self):
+        "Remove rings older than the committed one and the previous one"
+        checkpoint = self.store.checkpoint()
+        if not checkpoint or "ring" not in checkpoint:
+            return
+        committed = int(checkpoint["ring"].split(".")[1])
+        self.generation = committed  # a ring without a commit is dropped
+        for path in self.folder.glob("ring.*.npz*"):
+            if int(path.name.split(".")[1]) not in (committed, committed - 1):
+                path.unlink()
+
+    def flush(self, checkpoint: dict | None = None):
+        "Flush the all time counts as a segment, committed with the ring"
+        ring = self._save_ring()
+        self.store.flush(checkpoint=dict(checkpoint or {}, ring=ring))
+        self._retire_rings()
+
+    def write(self, checkpoint: dict | None = None):
+        ring = self._save_ring()
+        self.store.write(checkpoint=dict(checkpoint or {}, ring=ring))
+        self._retire_rings()
@@ -0,0 +1,79 @@
+from collections import Counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from locutions import rollback
+from timed import TimedLocutions
+
+HOUR = 3600
+
+
+def test_window():
+    with TemporaryDirectory() as temp:
+        loc = TimedLocutions(Path(temp) / "test", size=3, create=True)
+        loc.add_document(["je", "mange", "des", "des"], 0)
+        loc.add_document(["des", "pois"], HOUR + 10)
+        loc.add_counter(Counter(["des", "pois"]), 2 * HOUR)
+        assert (4, 3) == loc["des"]
+        assert (4.0, 3.0) == loc.window("des")
+        assert (2.0, 2.0) == loc.window("des", window=2)
+        assert (1.0, 1.0) == loc.window("des", window=1)
+        tf, _, docs = loc.window_counts(window=2)
+        assert 2 == docs
+        assert 2 == tf[loc.store.ord("pois")]
+        assert 0 == tf[loc.store.ord("mange")]
+
+        loc.add_document(["des"], 3 * HOUR)  # the first hour leaves the ring
+        assert (3.0, 3.0) == loc.window("des")
+        assert (0.0, 0.0) == loc.window("mange")
+        assert (5, 4) == loc["des"], "all time counts are kept"
+
+        loc.add_document(["mange"], 0)  # too old for the ring
+        assert (0.0, 0.0) == loc.window("mange")
+        assert (2, 2) == loc["mange"]
+
+
+def test_decay():
+    with TemporaryDirectory() as temp:
+        loc = TimedLocutions(Path(temp) / "test", size=4, create=True)
+        loc.add_document(["des"], 0)
+        loc.add_document(["des"], 2 * HOUR)
+        tf, _ = loc.window("des", half_life=2)
+        assert 1.5 == tf
+        tf, _, docs = loc.window_counts(half_life=1)
+        assert 1.25 == tf[loc.store.ord("des")]
+        assert 1.25 == docs
+
+
+def test_persist():
+    with TemporaryDirectory() as temp:
+        loc = TimedLocutions(Path(temp) / "test", size=3, create=True)
+        loc.add_document(["je", "mange", "des"], 0)
+        loc.flush()
+        loc.add_document(["des", "pois"], HOUR)
+        loc.write()
+        again = TimedLocutions(Path(temp) / "test")
+        assert 3 == again.size
+        assert (2.0, 2.0) == again.window("des")
+        assert (1.0, 1.0) == again.window("pois", window=1)
+        assert 2 == again.total()
+
+
+def test_ring_commit():
+    with TemporaryDirectory() as temp:
+        folder = Path(temp) / "test"
+        loc = TimedLocutions(folder, size=3, create=True)
+        loc.add_document(["je", "mange", "des"], 0)
+        loc.flush(checkpoint={"documents": 1})
+        loc.add_document(["des", "pois"], HOUR)
+        loc.write(checkpoint={"documents": 2})
+        assert {"documents": 2, "ring": "ring.000002.npz"} == loc.store.checkpoint()
+        loc.add_document(["pois"], 2 * HOUR)
+        loc._save_ring()  # interrupted before the store commit
+        again = TimedLocutions(folder)
+        assert (1.0, 1.0) == again.window("pois")
+        rollback(folder)
+        again = TimedLocutions(folder)
+        assert "pois" not in again
+        assert (1.0, 1.0) == again.window("des")
+        assert {"documents": 1, "ring": "ring.000001.npz"} == again.store.checkpoint()
@@ -1,10 +1,14 @@
 from array import array
 from collections.abc import Iterator
 from itertools import chain
+import mmap
+import os
 from pathlib import Path
-from typing import Generator
+import struct
+from typing import Generator, Iterable
 
 from marisa_trie import Trie
+import numpy as np
 
 
 class KeysReader:
@@ -32,6 +36,16 @@ class Loop:
         return chain(*self.gens)
 
 
+CHUNK = 1 << 16  # keys converted at once while iterating
+
+STAMP = struct.Struct("QQ")  # size and mtime_ns of the keys file used to build the trie
+
+
+def side_files(path: Path) -> tuple[Path, Path]:
+    "Compiled trie and ids files, next to the keys file"
+    return path.with_suffix(".marisa"), path.with_suffix(".ids")
+
+
 class OrderedTrie:
     """
     A Trie, built from a list of uniques lines.
@@ -40,18 +54,73 @@ class OrderedTrie:
 
     file: Path
     trie: Trie
-    ids: array("I")
+    ids: array | memoryview
+    _order: np.ndarray | None = None  # trie ids by position, the inverse of ids
 
     @classmethod
-    def fromfile(cls, path: Path | str):
+    def fromfile(cls, path: Path | str, cache: bool = True):
+        """
+        Open the keys of a file.
+        The compiled trie is saved next to the file, and mapped on the next opening,
+        as long as the file doesn't change.
+        """
+        if isinstance(path, str):
+            path = Path(path)
+        if cache:
+            o = cls.load(path)
+            if o is not None:
+                return o
         o = cls(KeysReader(path))
+        if cache:
+            try:
+                o.save(path)
+            except OSError:  # read only folder, the trie will be built again next time
+                pass
         return o
 
+    @classmethod
+    def load(cls, path: Path):
+        "Map the compiled trie of a keys file, None if it's missing or stale"
+        f_trie, f_ids = side_files(path)
+        if not (path.exists() and f_trie.exists() and f_ids.exists()):
+            return None
+        with f_ids.open("rb") as f:
+            if f_ids.lstat().st_size < STAMP.size:
+                return None
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        stat = path.lstat()
+        if STAMP.unpack_from(m) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        o = cls.__new__(cls)
+        o.trie = Trie()
+        o.trie.mmap(str(f_trie))
+        o.ids = memoryview(m)[STAMP.size :].cast("I")
+        if len(o.trie) != len(o.ids):
+            return None
+        return o
+
+    def save(self, path: Path):
+        """
+        Save the compiled trie next to the keys file it was built from.
+        Files are renamed over the old ones, mapped readers are not disturbed.
+        """
+        f_trie, f_ids = side_files(path)
+        tmp = f_trie.with_suffix(".marisa.tmp")
+        self.trie.save(str(tmp))
+        os.replace(tmp, f_trie)
+        tmp = f_ids.with_suffix(".ids.tmp")
+        with tmp.open("wb") as f:
+            stat = path.lstat()
+            f.write(STAMP.pack(stat.st_size, stat.st_mtime_ns))
+            f.write(memoryview(self.ids).cast("B"))
+        os.replace(tmp, f_ids)
+
     def __init__(self, gen: Iterator[str]):
         self.trie = Trie(gen)
-        self.ids = array("I", [0] * len(self.trie))
-        for i, line in enumerate(gen):
-            self.ids[self.trie[line]] = i
+        tids = np.fromiter(map(self.trie.key_id, gen), dtype=np.int64)
+        ids = np.zeros(len(self.trie), dtype=np.uint32)
+        ids[tids] = np.arange(len(tids), dtype=np.uint32)
+        self.ids = array("I", ids.tobytes())
 
     def __getitem__(self, key: str) -> int:
         id_ = self.trie[key]
@@ -65,8 +134,46 @@ class OrderedTrie:
             raise IOError("OrderedTrie storage out of sync")
         return len(self.trie)
 
-    def __iter__(self):
-        return (self.trie.restore_key(id_) for id_ in reverse(self.ids))
+    def __iter__(self) -> Generator[str, None, None]:
+        "Keys by position, trie ids are converted to Python ints chunk by chunk"
+        order = self.order()
+        restore = self.trie.restore_key
+        for start in range(0, len(order), CHUNK):
+            yield from map(restore, order[start : start + CHUNK].tolist())
+
+    def key(self, position: int) -> str:
+        "Key at a position"
+        return self.trie.restore_key(int(self.order()[position]))
+
+    def order(self) -> np.ndarray:
+        "Trie ids by position, computed once, for random access"
+        if self._order is None:
+            self._order = np.asarray(reverse(self.ids), dtype=np.uint32)
+        return self._order
+
+    def lookup_many(self, keys: Iterable[str]) -> np.ndarray:
+        "Positions of a batch of keys, -1 for missing keys"
+        get = self.trie.get
+        tids = np.fromiter((get(k, -1) for k in keys), dtype=np.int64)
+        found = tids >= 0
+        positions = np.full(len(tids), -1, dtype=np.int64)
+        positions[found] = np.asarray(self.ids, dtype=np.uint32)[tids[found]]
+        return positions
+
+    def items(self, prefix: str = "") -> Generator[tuple[str, int], None, None]:
+        "Keys starting with a prefix, and their positions, in trie order"
+        for key, id_ in self.trie.iteritems(prefix):
+            yield key, self.ids[id_]
+
+    def prefix(self, prefix: str) -> tuple[list[str], np.ndarray]:
+        "Keys starting with a prefix, and their positions, in one batch"
+        keys = []
+        tids = []
+        for key, id_ in self.trie.iteritems(prefix):
+            keys.append(key)
+            tids.append(id_)
+        ids = np.asarray(self.ids, dtype=np.uint32)[np.array(tids, dtype=np.int64)]
+        return keys, ids.astype(np.int64)
 
     def append(self, gen: Iterator[str]):
         "Return a new OrderedTrie with appended values"
@@ -79,7 +186,7 @@ def reverse(src: array) -> array:
 
     [3, 2, 0, 1] => [2, 3, 1,0]
     """
-    res = array("I", [0] * len(src))
-    for i, value in enumerate(src):
-        res[value] = i
-    return res
+    values = np.asarray(src, dtype=np.uint32)
+    res = np.zeros(len(values), dtype=np.uint32)
+    res[values] = np.arange(len(values), dtype=np.uint32)
+    return array("I", res.tobytes())
@@ -1,8 +1,10 @@
 from array import array
 from itertools import chain
+import os
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
+import trie
 from trie import OrderedTrie, reverse
 
 
@@ -38,6 +40,36 @@ poum
         assert 1 == t["pam"]
 
 
+def test_saved():
+    with TemporaryDirectory() as temp:
+        p = Path(temp) / "keys.txt"
+        p.write_text("pim\npam\npoum\n")
+        OrderedTrie.fromfile(p)
+        assert (Path(temp) / "keys.marisa").exists()
+        assert (Path(temp) / "keys.ids").exists()
+        t2 = OrderedTrie.fromfile(p)
+        assert isinstance(t2.ids, memoryview), "the saved trie is mapped"
+        assert 1 == t2["pam"]
+        assert ["pim", "pam", "poum"] == list(t2)
+        with p.open("a") as f:
+            f.write("the captain\n")
+        assert OrderedTrie.load(p) is None, "keys file has changed"
+        t3 = OrderedTrie.fromfile(p)
+        assert 3 == t3["the captain"]
+        assert 3 == OrderedTrie.load(p)["the captain"]
+
+
+def test_saved_same_size():
+    with TemporaryDirectory() as temp:
+        p = Path(temp) / "keys.txt"
+        p.write_text("pim\npam\npoum\n")
+        OrderedTrie.fromfile(p)
+        p.write_text("pum\npam\npoum\n")
+        os.utime(p, ns=(p.stat().st_atime_ns, p.stat().st_mtime_ns + 1))
+        assert OrderedTrie.load(p) is None, "keys file has changed"
+        assert 0 == OrderedTrie.fromfile(p)["pum"]
+
+
 def test_append():
     t = OrderedTrie(["pim", "pam", "poum"])
     assert 0 == t["pim"]
@@ -49,3 +81,32 @@ def test_append():
     assert 0 == t2["pim"]
     assert 1 == t2["pam"]
     assert 3 == t2["the captain"]
+
+
+def test_prefix():
+    t = OrderedTrie(["new york", "new", "new york city", "old york", "newton"])
+    assert [("new york", 0), ("new york city", 2)] == sorted(t.items("new "))
+    keys, ids = t.prefix("new")
+    assert {"new": 1, "new york": 0, "new york city": 2, "newton": 4} == dict(
+        zip(keys, ids.tolist())
+    )
+    keys, ids = t.prefix("paris")
+    assert [] == keys
+    assert 0 == len(ids)
+
+
+def test_lookup_many():
+    t = OrderedTrie(["je", "mange", "des", "carottes"])
+    assert [2, -1, 0] == t.lookup_many(["des", "pois", "je"]).tolist()
+    assert 0 == len(t.lookup_many([]))
+    assert [0, 1, 2, 3] == [t.ids[i] for i in t.order()]
+
+
+def test_iter_chunks(monkeypatch):
+    monkeypatch.setattr(trie, "CHUNK", 3)
+    words = ["je", "mange", "des", "carottes", "et", "des petits", "pois"]
+    t = OrderedTrie(words)
+    assert words == list(t)
+    order = t._order
+    assert words == list(t)
+    assert order is t._order, "the order is computed once"
@@ -12,7 +12,7 @@ from defusedxml import ElementTree as ET
 dctx = zstandard.ZstdDecompressor()
 
 
-@dataclass(init=False)
+@dataclass(init=False, slots=True)
 class Doc:
     """
     Wikipedia abstract document
@@ -29,52 +29,150 @@ class Doc:
     abstract: str
 
 
-def wiki(path: Path | str) -> Generator[Doc, None, None]:
+def open_dump(path: Path | str) -> BinaryIO:
     """
-    Read a archive and yield Doc.
+    Open an archive.
     If path is "-", source is STDIN.
     File can be compressed with zstd or gzip.
     """
     if isinstance(path, str):
         if path == "-":
-            for d in docs(sys.stdin.buffer):
-                yield d
-            return
+            return sys.stdin.buffer
         path = Path(path)
     if path.suffix == ".zst":
-        with open(path, "rb") as fh:
-            for d in docs(dctx.stream_reader(fh)):
-                yield d
+        return dctx.stream_reader(open(path, "rb"), closefd=True)
     elif path.suffix == ".gz":
-        for d in docs(gzip.open(path, mode="rb")):
-            yield d
-    else:
-        for d in docs(path.open(encoding="utf8")):
+        return gzip.open(path, mode="rb")
+    return path.open("rb")
+
+
+def wiki(path: Path | str, fast: bool = False) -> Generator[Doc, None, None]:
+    """
+    Read a archive and yield Doc.
+    If path is "-", source is STDIN.
+    File can be compressed with zstd or gzip.
+    With fast, the streaming parser is used.
+    """
+    with open_dump(path) as reader:
+        for d in records(reader) if fast else docs(reader):
             yield d
 
 
+def title(txt: str) -> str:
+    if txt.startswith("Wikipedia: "):
+        return txt[11:]
+    return txt
+
+
 def docs(reader: BinaryIO) -> Generator[Doc, None, None]:
     "Parse Wikipedia abstract's XML format"
     doc = Doc()
-    for event, elem in ET.iterparse(reader):
+    events = ET.iterparse(reader, events=("start", "end"))
+    _, root = next(events)
+    for event, elem in events:
         if event == "end":
             if elem.tag == "doc":
                 yield doc
                 doc = Doc()
+                root.clear()  # parsed docs are not kept in the tree
             elif elem.tag == "title":
-                if elem.text.startswith("Wikipedia: "):
-                    doc.title = elem.text[11:]
-                else:
-                    doc.title = elem.text
+                doc.title = title(elem.text)
             elif elem.tag == "url":
                 doc.url = elem.text
             elif elem.tag == "abstract":
                 doc.abstract = elem.text
 
 
+class Abstracts:
+    "Expat handlers, building Doc without building the tree"
+
+    docs: list[Doc]
+
+    def __init__(self):
+        self.docs = []
+        self.doc = Doc()
+        self.text = []
+
+    def start(self, tag: str, attrib: list):
+        self.text.clear()
+
+    def data(self, data: str):
+        self.text.append(data)
+
+    def end(self, tag: str):
+        if tag == "doc":
+            self.docs.append(self.doc)
+            self.doc = Doc()
+        elif tag == "title":
+            self.doc.title = title("".join(self.text))
+        elif tag == "url":
+            self.doc.url = "".join(self.text)
+        elif tag == "abstract":
+            self.doc.abstract = "".join(self.text)
+
+
+def records(reader: BinaryIO, chunk_size: int = 1 << 16) -> Generator[Doc, None, None]:
+    """
+    Parse Wikipedia abstract's XML format, streaming.
+    The dump is fed by chunks to the defused parser, memory doesn't depend
+    on the size of the dump.
+    """
+    target = Abstracts()
+    # defusedxml guards (entities, external references) are set on the expat
+    # parser, element and text callbacks go straight from expat to the target.
+    expat = ET.XMLParser().parser
+    expat.buffer_text = True
+    expat.ordered_attributes = True
+    expat.StartElementHandler = target.start
+    expat.EndElementHandler = target.end
+    expat.CharacterDataHandler = target.data
+    while True:
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            break
+        expat.Parse(chunk, False)
+        yield from target.docs
+        target.docs.clear()
+    expat.Parse(b"", True)
+    yield from target.docs
+
+
+class Meter:
+    "Count bytes read from a reader"
+
+    size: int
+
+    def __init__(self, reader: BinaryIO):
+        self.reader = reader
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.reader.read(size)
+        self.size += len(data)
+        return data
+
+
 if __name__ == "__main__":
+    import argparse
+    from time import perf_counter
+
     from tqdm import tqdm
 
-    reader = wiki(sys.argv[1])
-    for doc in tqdm(reader, unit=" docs", delay=30):
-        pass
+    parser = argparse.ArgumentParser(description="Parse a Wikipedia abstract dump")
+    parser.add_argument("dump", help="xml, xml.gz or xml.zst dump, - for STDIN")
+    parser.add_argument("--fast", action="store_true", help="streaming parser")
+    args = parser.parse_args()
+
+    with open_dump(args.dump) as raw:
+        reader = Meter(raw)
+        parse = records if args.fast else docs
+        start = perf_counter()
+        n = 0
+        for doc in tqdm(parse(reader), unit=" docs", delay=30):
+            n += 1
+        elapsed = perf_counter() - start
+    print(
+        f"{n} docs in {elapsed:.1f}s: {n / elapsed:.0f} docs/s,",
+        f"{reader.size / elapsed / 1e6:.1f} MB/s",
+        file=sys.stderr,
+    )
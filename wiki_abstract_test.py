@@ -1,9 +1,11 @@
 from io import BytesIO
-from wiki_abstract import docs
 
+import pytest
+from defusedxml import EntitiesForbidden
 
-def test_doc():
-    txt = b"""
+from wiki_abstract import docs, records
+
+txt = b"""
 <feed>
 <doc>
 <title>Wikipedia: Anarchism</title>
@@ -13,8 +15,39 @@ def test_doc():
 <sublink linktype="nav"><anchor>Etymology, terminology, and definition</anchor><link>https://en.wikipedia.org/wiki/Anarchism#Etymology,_terminology,_and_definition</link></sublink>
 </links>
 </doc>
+<doc>
+<title>Wikipedia: Albedo</title>
+<url>https://en.wikipedia.org/wiki/Albedo</url>
+<abstract>Albedo is the fraction of sunlight that is diffusely reflected by a body.</abstract>
+<links>
+</links>
+</doc>
 </feed>
     """
+
+bomb = b"""<?xml version="1.0"?>
+<!DOCTYPE feed [<!ENTITY a "aaaaaaaaaa"><!ENTITY b "&a;&a;&a;&a;&a;">]>
+<feed><doc><title>&b;</title></doc></feed>
+"""
+
+
+def test_doc():
     d = list(docs(BytesIO(txt)))
-    assert 1 == len(d)
+    assert 2 == len(d)
     assert "Anarchism" == d[0].title
+
+
+def test_records():
+    d = list(records(BytesIO(txt), chunk_size=7))
+    assert 2 == len(d)
+    assert "Anarchism" == d[0].title
+    assert "https://en.wikipedia.org/wiki/Albedo" == d[1].url
+    assert d[1].abstract.startswith("Albedo is the fraction")
+    assert list(docs(BytesIO(txt))) == d
+
+
+def test_defused():
+    with pytest.raises(EntitiesForbidden):
+        list(docs(BytesIO(bomb)))
+    with pytest.raises(EntitiesForbidden):
+        list(records(BytesIO(bomb)))